@@ -2,11 +2,15 @@
 # Логика аутентификации администратора и работы с сессиями.
 
 # Импортируем системные инструменты.
+import base64
+import json
 import os
 import secrets
 
 # Импортируем типы FastAPI.
 from fastapi import Request, HTTPException, status
+# Импортируем подпись cookie сессии (тот же формат, что у SessionMiddleware).
+from itsdangerous import BadSignature, TimestampSigner
 
 # Настройки учётных данных администратора.
 ADMIN_LOGIN = os.getenv('ADMIN_LOGIN', 'bodryakov')
@@ -15,6 +19,13 @@ ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'bod')
 # Ключ для CSRF-токенов.
 CSRF_SECRET = os.getenv('CSRF_SECRET', 'change_me_csrf_secret')
 
+# Настройки cookie сессии.
+SESSION_SECRET = os.getenv('SESSION_SECRET', 'change_me_super_secret')
+SESSION_COOKIE = 'session'
+SESSION_MAX_AGE = 60 * 60 * 24 * 30  # 30 дней
+
+_session_signer = TimestampSigner(SESSION_SECRET)
+
 # Проверяем логин/пароль.
 def verify_credentials(login: str, password: str) -> bool:
     # Сравниваем введённые данные с настройками.
@@ -30,6 +41,17 @@ def clear_admin_session(request: Request) -> None:
     # Удаляем данные админа из сессии.
     request.session.pop('is_admin', None)
 
+# Проверяем cookie сессии без SessionMiddleware: подпись не истекла и в сессии есть флаг администратора.
+def session_cookie_is_admin(cookie: str | None) -> bool:
+    if not cookie:
+        return False
+    try:
+        data = _session_signer.unsign(cookie.encode('utf-8'), max_age=SESSION_MAX_AGE)
+        session = json.loads(base64.b64decode(data))
+    except (BadSignature, ValueError):
+        return False
+    return isinstance(session, dict) and bool(session.get('is_admin'))
+
 # Проверяем, что пользователь является администратором.
 def require_admin(request: Request) -> None:
     # Если нет флага авторизации — запрещаем доступ.
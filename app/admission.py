@@ -0,0 +1,194 @@
+﻿# Назначение файла:
+# Контроль допуска запросов: отдельные ограниченные пулы для публичного чтения, админки и загрузок
+# с ограниченной очередью ожидания; не допущенные вовремя запросы сразу получают 503 с Retry-After.
+
+# Импортируем системные инструменты.
+import asyncio
+import math
+import os
+from collections import deque
+
+# Импортируем типы.
+from typing import Any, Dict
+
+# Импортируем FastAPI компоненты.
+from fastapi import APIRouter, Request
+# Импортируем ответы.
+from fastapi.responses import HTMLResponse
+# Импортируем разбор заголовка Cookie.
+from starlette.requests import cookie_parser
+
+# Импортируем проверку админ-доступа.
+from app.admin_auth import SESSION_COOKIE, require_admin, session_cookie_is_admin
+# Импортируем быстрый JSON-ответ.
+from app.json_response import FastJSONResponse
+
+# Создаём роутер статистики допуска.
+admission_router = APIRouter()
+
+
+# Запрос не допущен: очередь заполнена или истёк дедлайн ожидания.
+class Overloaded(Exception):
+    def __init__(self, pool: 'AdmissionPool') -> None:
+        super().__init__(pool.name)
+        self.pool = pool
+
+
+# Пул допуска: не больше limit одновременных запросов и не больше queue_size ожидающих.
+# Работает в потоке event loop, поэтому счётчики не требуют блокировок.
+class AdmissionPool:
+    def __init__(self, name: str, limit: int, queue_size: int, wait_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.wait_timeout = wait_timeout
+        self._active = 0
+        self._waiters: deque = deque()
+        # Счётчики для диагностики.
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    # Сколько секунд клиенту стоит подождать перед повтором.
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.wait_timeout))
+
+    # Занимаем место в пуле или ждём его не дольше wait_timeout.
+    async def acquire(self) -> None:
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected_queue_full += 1
+            raise Overloaded(self)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.wait_timeout)
+        except asyncio.TimeoutError:
+            # Место могло освободиться одновременно с истечением дедлайна.
+            if waiter.done() and not waiter.cancelled():
+                self.admitted += 1
+                return
+            self.rejected_timeout += 1
+            raise Overloaded(self)
+        except asyncio.CancelledError:
+            # Клиент ушёл, но место уже передано нам — возвращаем его.
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    # Освобождаем место: передаём его первому ожидающему или уменьшаем счётчик.
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'active': self._active,
+            'queued': len(self._waiters),
+            'queue_size': self.queue_size,
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+
+# Создаём пул с настройками из окружения: ADMISSION_<NAME>_LIMIT, _QUEUE, _WAIT.
+def _pool(name: str, limit: int, queue_size: int, wait_timeout: float) -> AdmissionPool:
+    prefix = f'ADMISSION_{name.upper()}'
+    return AdmissionPool(
+        name,
+        int(os.getenv(f'{prefix}_LIMIT', str(limit))),
+        int(os.getenv(f'{prefix}_QUEUE', str(queue_size))),
+        float(os.getenv(f'{prefix}_WAIT', str(wait_timeout))),
+    )
+
+
+# Пулы воркера.
+ADMISSION_POOLS = {
+    'public': _pool('public', 64, 256, 1.0),
+    'admin': _pool('admin', 8, 32, 5.0),
+    'upload': _pool('upload', 4, 16, 10.0),
+}
+
+# Пути без допуска: статика и сама статистика (должна открываться и под перегрузкой).
+UNLIMITED_PREFIXES = ('/static/', '/api/admission')
+# Пути загрузки изображений.
+UPLOAD_PATHS = ('/api/upload-image', '/api/upload-images', '/api/images/lookup')
+# Публичные записи (попытки тестов, beacon) идут в публичный пул.
+PUBLIC_WRITE_SUFFIXES = ('/attempts', '/beacon')
+
+
+# Сессия администратора по cookie запроса (подпись проверяется без SessionMiddleware).
+def _is_admin_request(scope) -> bool:
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            return session_cookie_is_admin(cookie_parser(value.decode('latin-1')).get(SESSION_COOKIE))
+    return False
+
+# Выбираем пул по методу и пути запроса. Пулы админки и загрузок — только для действующей
+# сессии администратора: анонимные запросы к /api и /bod не должны занимать их места.
+def classify(scope) -> AdmissionPool | None:
+    method, path = scope['method'], scope['path']
+    if path.startswith(UNLIMITED_PREFIXES):
+        return None
+    if path.startswith('/api/') and method == 'POST' and path.endswith(PUBLIC_WRITE_SUFFIXES):
+        return ADMISSION_POOLS['public']
+    if path in UPLOAD_PATHS or path.startswith(('/bod', '/api/')):
+        if not _is_admin_request(scope):
+            return ADMISSION_POOLS['public']
+        return ADMISSION_POOLS['upload' if path in UPLOAD_PATHS else 'admin']
+    return ADMISSION_POOLS['public']
+
+
+# ASGI-middleware допуска: место в пуле занято до конца отправки ответа (включая потоковые).
+class AdmissionMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        pool = classify(scope) if scope['type'] == 'http' else None
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await pool.acquire()
+        except Overloaded:
+            await self._overloaded(pool, scope['path'])(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
+
+    # Быстрый ответ 503 без обращения к приложению.
+    @staticmethod
+    def _overloaded(pool: AdmissionPool, path: str):
+        headers = {'Retry-After': str(pool.retry_after)}
+        if path.startswith('/api/'):
+            return FastJSONResponse({'detail': 'Сервер перегружен, повторите запрос позже.'}, status_code=503, headers=headers)
+        return HTMLResponse(
+            '<h1>Сервер перегружен</h1><p>Попробуйте обновить страницу через несколько секунд.</p>',
+            status_code=503,
+            headers=headers,
+        )
+
+
+# Очереди и отказы по пулам (для админки и мониторинга).
+@admission_router.get('/api/admission')
+async def admission_stats(request: Request):
+    require_admin(request)
+    return FastJSONResponse({name: pool.stats() for name, pool in ADMISSION_POOLS.items()})
@@ -0,0 +1,93 @@
+﻿# Назначение файла:
+# Серверная проверка тестов урока: ключи ответов, оценивание и буферизованное сохранение попыток.
+
+# Импортируем системные инструменты.
+import os
+import threading
+import time
+
+# Импортируем типы.
+from typing import Dict, Any, List, Tuple
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import get_lesson_tests, insert_attempts, on_content_write
+# Импортируем буфер отложенной записи.
+from app.buffers import WriteBehindBuffer, register_buffer
+# Импортируем индекс маршрутов и его время жизни (ключи ответов обновляются с той же задержкой).
+from app.route_index import ROUTE_INDEX_TTL, route_index
+
+# Пороги сброса попыток: по количеству и по возрасту (сек.).
+ATTEMPTS_FLUSH_SIZE = int(os.getenv('ATTEMPTS_FLUSH_SIZE', '200'))
+ATTEMPTS_FLUSH_INTERVAL = float(os.getenv('ATTEMPTS_FLUSH_INTERVAL', '5'))
+# Максимальное число ключей ответов в кэше.
+ANSWER_KEYS_MAX = int(os.getenv('ANSWER_KEYS_MAX', '5000'))
+# Время жизни ключа ответов (сек.): правки на других воркерах сбрасывают кэш только у себя.
+ANSWER_KEYS_TTL = float(os.getenv('ANSWER_KEYS_TTL', str(ROUTE_INDEX_TTL)))
+
+# Кэш ключей ответов: lesson_id -> (момент истечения, список правильных индексов или None — урок недоступен).
+_answer_keys: Dict[str, Tuple[float, List[int] | None]] = {}
+_answer_keys_lock = threading.Lock()
+
+# Буфер попыток с пакетной вставкой.
+attempts_buffer = register_buffer(WriteBehindBuffer(
+    'lesson_attempts',
+    insert_attempts,
+    max_items=ATTEMPTS_FLUSH_SIZE,
+    max_age=ATTEMPTS_FLUSH_INTERVAL,
+))
+
+
+# Сбрасываем ключи ответов при изменении уроков.
+@on_content_write
+def _invalidate_answer_keys(table: str, row_id: str | None) -> None:
+    if table != 'lessons':
+        return
+    with _answer_keys_lock:
+        if row_id:
+            _answer_keys.pop(row_id, None)
+        else:
+            _answer_keys.clear()
+
+# Получаем ключ ответов опубликованного урока (блокирующий вызов).
+def get_answer_key(lesson_id: str) -> List[int] | None:
+    # Неизвестные и неопубликованные id отсекаются по индексу, без обращения к базе и кэшу.
+    if route_index.published_lesson(lesson_id) is None:
+        return None
+    with _answer_keys_lock:
+        cached = _answer_keys.get(lesson_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+    lesson = get_lesson_tests(lesson_id)
+    key = None
+    if lesson and lesson.get('status') == 'published':
+        key = [int(test.get('correct_index', 0)) for test in (lesson.get('tests') or [])]
+    with _answer_keys_lock:
+        if len(_answer_keys) >= ANSWER_KEYS_MAX:
+            _answer_keys.clear()
+        _answer_keys[lesson_id] = (time.monotonic() + ANSWER_KEYS_TTL, key)
+    return key
+
+# Оцениваем ответы по ключу.
+def grade(answer_key: List[int], answers: List[int | None]) -> Dict[str, Any]:
+    # Дополняем/обрезаем ответы до числа вопросов.
+    answers = (list(answers) + [None] * len(answer_key))[:len(answer_key)]
+    results = [answer is not None and answer == correct for answer, correct in zip(answers, answer_key)]
+    return {
+        'answers': answers,
+        'results': results,
+        'score': sum(results),
+        'total': len(answer_key),
+        'answered': sum(answer is not None for answer in answers),
+    }
+
+# Записываем попытку в буфер (сброс в базу — пакетами).
+def record_attempt(lesson_id: str, graded: Dict[str, Any]) -> None:
+    due = attempts_buffer.add({
+        'lesson_id': lesson_id,
+        'answers': graded['answers'],
+        'results': graded['results'],
+        'score': graded['score'],
+        'total': graded['total'],
+    })
+    if due:
+        attempts_buffer.schedule_flush()
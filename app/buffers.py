@@ -0,0 +1,220 @@
+﻿# Назначение файла:
+# Буферы отложенной записи (write-behind): накопление записей в памяти и пакетный сброс в базу.
+
+# Импортируем системные инструменты.
+import asyncio
+import logging
+import threading
+import time
+
+# Импортируем типы.
+from typing import Any, Callable, Dict, List, Tuple
+
+# Импортируем классификацию ошибок Supabase.
+from app.resilience import is_client_error
+
+# Логгер модуля.
+logger = logging.getLogger(__name__)
+
+
+# Буфер записей со сбросом по размеру или по времени.
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Any]], None],
+        max_items: int = 200,
+        max_age: float = 5.0,
+        max_pending: int = 10000,
+    ) -> None:
+        # Имя буфера (для логов и диагностики).
+        self.name = name
+        # Функция пакетной записи.
+        self._flush_fn = flush_fn
+        # Порог размера, возраст самой старой записи и жёсткий лимит накопления.
+        self.max_items = max_items
+        self.max_age = max_age
+        self.max_pending = max_pending
+        # Накопленные записи и момент появления первой из них.
+        self._items: List[Any] = []
+        self._first_at = 0.0
+        # Блокировки: для списка и для сериализации сбросов.
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Счётчики для диагностики.
+        self.flushed = 0
+        self.dropped = 0
+
+    # Добавляем запись; возвращаем True, если пора сбрасывать буфер.
+    def add(self, item: Any) -> bool:
+        with self._lock:
+            if not self._items:
+                self._first_at = time.monotonic()
+            self._items.append(item)
+            return len(self._items) >= self.max_items
+
+    # Проверяем, истёк ли возраст буфера.
+    def is_due(self) -> bool:
+        with self._lock:
+            return bool(self._items) and time.monotonic() - self._first_at >= self.max_age
+
+    # Сбрасываем накопленные записи одной пакетной операцией.
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+            if not items:
+                return 0
+            try:
+                self._flush_fn(items)
+            except Exception as exc:
+                # Ошибка данных (4xx PostgREST) не исчезнет при повторе: записываем пакет по одной записи.
+                if is_client_error(exc):
+                    return self._flush_one_by_one(items)
+                logger.exception('Не удалось сбросить буфер %s', self.name)
+                self._requeue(items)
+                return 0
+            self.flushed += len(items)
+            return len(items)
+
+    # Возвращаем записи в начало буфера, не превышая лимит.
+    def _requeue(self, items: List[Any]) -> None:
+        with self._lock:
+            self._items = items + self._items
+            overflow = len(self._items) - self.max_pending
+            if overflow > 0:
+                self._items = self._items[overflow:]
+                self.dropped += overflow
+            self._first_at = time.monotonic()
+
+    # Записываем пакет по одной записи: отклонённые базой записи отбрасываем,
+    # при сбое Supabase возвращаем оставшиеся в буфер.
+    def _flush_one_by_one(self, items: List[Any]) -> int:
+        written = 0
+        for index, item in enumerate(items):
+            try:
+                self._flush_fn([item])
+            except Exception as exc:
+                if not is_client_error(exc):
+                    logger.exception('Не удалось сбросить буфер %s', self.name)
+                    self._requeue(items[index:])
+                    break
+                logger.warning('Буфер %s: запись отклонена базой и отброшена: %r (%s)', self.name, item, exc)
+                self.dropped += 1
+            else:
+                written += 1
+        self.flushed += written
+        return written
+
+    # Планируем сброс в пуле потоков, не блокируя обработку запроса.
+    def schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        loop.run_in_executor(None, self.flush)
+
+    # Состояние буфера (для диагностики).
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._items)
+        return {'pending': pending, 'flushed': self.flushed, 'dropped': self.dropped}
+
+
+# Буфер счётчиков: суммирует приращения по ключу и сбрасывает только дельты.
+class CounterBuffer:
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[Dict[Tuple, List[int]]], None],
+        width: int,
+        max_age: float = 10.0,
+        max_keys: int = 10000,
+    ) -> None:
+        # Имя буфера (для логов и диагностики).
+        self.name = name
+        # Функция пакетной записи дельт.
+        self._flush_fn = flush_fn
+        # Число счётчиков на ключ, период сброса и лимит ключей.
+        self.width = width
+        self.max_age = max_age
+        self.max_keys = max_keys
+        # Накопленные дельты и момент первого приращения.
+        self._deltas: Dict[Tuple, List[int]] = {}
+        self._first_at = 0.0
+        # Блокировки: для словаря и для сериализации сбросов.
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Счётчики для диагностики.
+        self.flushed = 0
+        self.dropped = 0
+
+    # Прибавляем значения к счётчикам ключа.
+    def add(self, key: Tuple, *values: int) -> None:
+        with self._lock:
+            if not self._deltas:
+                self._first_at = time.monotonic()
+            row = self._deltas.get(key)
+            if row is None:
+                if len(self._deltas) >= self.max_keys:
+                    self.dropped += 1
+                    return
+                row = self._deltas[key] = [0] * self.width
+            for i, value in enumerate(values):
+                row[i] += value
+
+    # Проверяем, истёк ли возраст буфера.
+    def is_due(self) -> bool:
+        with self._lock:
+            return bool(self._deltas) and time.monotonic() - self._first_at >= self.max_age
+
+    # Сбрасываем накопленные дельты одной пакетной операцией.
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return 0
+            try:
+                self._flush_fn(deltas)
+            except Exception:
+                logger.exception('Не удалось сбросить счётчики %s', self.name)
+                # Возвращаем дельты обратно, складывая с новыми.
+                with self._lock:
+                    for key, values in deltas.items():
+                        row = self._deltas.setdefault(key, [0] * self.width)
+                        for i, value in enumerate(values):
+                            row[i] += value
+                    self._first_at = time.monotonic()
+                return 0
+            self.flushed += len(deltas)
+            return len(deltas)
+
+    # Состояние буфера (для диагностики).
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._deltas)
+        return {'pending': pending, 'flushed': self.flushed, 'dropped': self.dropped}
+
+
+# Зарегистрированные буферы приложения.
+_buffers: List[Any] = []
+
+# Регистрируем буфер для периодического сброса.
+def register_buffer(buffer: Any) -> Any:
+    _buffers.append(buffer)
+    return buffer
+
+# Фоновый цикл: сбрасываем буферы, у которых истёк возраст.
+async def run_flush_loop(interval: float = 1.0) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        for buffer in list(_buffers):
+            if buffer.is_due():
+                await asyncio.to_thread(buffer.flush)
+
+# Сбрасываем все буферы (при остановке приложения).
+def flush_all() -> None:
+    for buffer in list(_buffers):
+        buffer.flush()
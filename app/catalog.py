@@ -0,0 +1,164 @@
+﻿# Назначение файла:
+# Компактный каталог навигации: записи со __slots__ вместо словарей PostgREST, интернированные строки,
+# опубликованные уроки заранее упорядочены по (section_id, number) с диапазонами по разделам.
+# Отчёт о памяти: python -m app.catalog [--lessons 10000]
+
+# Импортируем системные инструменты.
+import argparse
+import json
+import sys
+
+# Импортируем типы.
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+# Раздел в каталоге.
+class SectionEntry:
+    __slots__ = ('id', 'number', 'title', 'slug', 'updated_at')
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        self.id = sys.intern(row['id'])
+        self.number = row['number']
+        self.title = row['title']
+        self.slug = sys.intern(row['slug'])
+        self.updated_at = row.get('updated_at')
+
+
+# Урок в каталоге (без контента); position — индекс в упорядоченном массиве уроков.
+class LessonEntry:
+    __slots__ = ('id', 'section_id', 'number', 'title', 'slug', 'status', 'updated_at', 'position')
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        self.id = sys.intern(row['id'])
+        self.section_id = sys.intern(row['section_id'])
+        self.number = row['number']
+        self.title = row['title']
+        self.slug = sys.intern(row['slug'])
+        self.status = sys.intern(row.get('status') or 'draft')
+        self.updated_at = row.get('updated_at')
+        self.position = -1
+
+
+# Неизменяемый снимок каталога; перестраивается целиком при обновлении индекса маршрутов.
+class Catalog:
+    __slots__ = ('sections', 'lessons', 'ranges', 'sections_by_key', 'lessons_by_key', 'lessons_by_id', 'section_ids', 'lesson_ids')
+
+    def __init__(self, sections: Iterable[Dict[str, Any]], lessons: Iterable[Dict[str, Any]]) -> None:
+        # Разделы по порядку номеров.
+        self.sections: Tuple[SectionEntry, ...] = tuple(sorted((SectionEntry(s) for s in sections), key=lambda s: s.number))
+        entries = [LessonEntry(l) for l in lessons]
+        # Известные идентификаторы, включая черновики.
+        self.section_ids = frozenset(s.id for s in self.sections)
+        self.lesson_ids = frozenset(l.id for l in entries)
+
+        # Опубликованные уроки, упорядоченные по (section_id, number).
+        published = sorted((l for l in entries if l.status == 'published'), key=lambda l: (l.section_id, l.number))
+        self.lessons: Tuple[LessonEntry, ...] = tuple(published)
+        # Диапазоны [start, end) уроков каждого раздела в self.lessons.
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+        for position, lesson in enumerate(self.lessons):
+            lesson.position = position
+            start, _ = self.ranges.get(lesson.section_id, (position, position))
+            self.ranges[lesson.section_id] = (start, position + 1)
+
+        self.sections_by_key: Dict[Tuple[int, str], SectionEntry] = {(s.number, s.slug): s for s in self.sections}
+        self.lessons_by_key: Dict[Tuple[str, int, str], LessonEntry] = {
+            (l.section_id, l.number, l.slug): l for l in self.lessons
+        }
+        # Опубликованные уроки по id (проверка адресов фрагментов).
+        self.lessons_by_id: Dict[str, LessonEntry] = {l.id: l for l in self.lessons}
+
+    # Проверяем, что запись с таким id существует.
+    def knows(self, table: str, row_id: str) -> bool:
+        ids = self.section_ids if table == 'sections' else self.lesson_ids if table == 'lessons' else ()
+        return row_id in ids
+
+    # Опубликованные уроки раздела по порядку номеров (срез без сортировки).
+    def section_lessons(self, section_id: str) -> Tuple[LessonEntry, ...]:
+        start, end = self.ranges.get(section_id, (0, 0))
+        return self.lessons[start:end]
+
+    # Предыдущий и следующий опубликованный урок того же раздела.
+    def neighbours(self, lesson: LessonEntry) -> Tuple[LessonEntry | None, LessonEntry | None]:
+        # Запись могла прийти из предыдущей версии каталога — находим её в текущей.
+        if not 0 <= lesson.position < len(self.lessons) or self.lessons[lesson.position] is not lesson:
+            lesson = self.lessons_by_key.get((lesson.section_id, lesson.number, lesson.slug))
+            if lesson is None:
+                return None, None
+        start, end = self.ranges[lesson.section_id]
+        position = lesson.position
+        prev_lesson = self.lessons[position - 1] if start < position < end else None
+        next_lesson = self.lessons[position + 1] if start <= position < end - 1 else None
+        return prev_lesson, next_lesson
+
+    # Память каталога в байтах (объекты и уникальные строки) и в пересчёте на урок.
+    def memory_usage(self) -> Dict[str, float]:
+        total = _deep_size(self)
+        return {
+            'bytes': total,
+            'lessons': len(self.lessons),
+            'bytes_per_lesson': round(total / len(self.lessons), 1) if self.lessons else 0.0,
+        }
+
+
+# Размер объекта с вложенными объектами; общие (интернированные) объекты считаются один раз.
+def _deep_size(root: Any) -> int:
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, type)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(type(obj), '__slots__'):
+            stack.extend(getattr(obj, name) for name in type(obj).__slots__ if hasattr(obj, name))
+    return total
+
+
+# Синтетический каталог для отчёта о памяти.
+def _synthetic_rows(sections_count: int, lessons_count: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    import uuid
+
+    sections = [
+        {'id': str(uuid.uuid4()), 'number': n + 1, 'title': f'Раздел {n + 1}', 'slug': f'section-{n + 1}',
+         'meta': {}, 'created_at': '2026-01-01T00:00:00+00:00', 'updated_at': '2026-01-01T00:00:00+00:00'}
+        for n in range(sections_count)
+    ]
+    lessons = [
+        {'id': str(uuid.uuid4()), 'section_id': sections[n % sections_count]['id'], 'number': n // sections_count + 1,
+         'title': f'Урок {n + 1}', 'slug': f'lesson-{n // sections_count + 1}', 'status': 'published',
+         'updated_at': '2026-01-01T00:00:00+00:00'}
+        for n in range(lessons_count)
+    ]
+    return sections, lessons
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Отчёт о памяти каталога навигации.')
+    parser.add_argument('--sections', type=int, default=50)
+    parser.add_argument('--lessons', type=int, default=10000)
+    args = parser.parse_args()
+
+    # Как и ответ PostgREST, каждая строка разбирается из JSON заново (строки не разделяются между строками).
+    sections, lessons = json.loads(json.dumps(_synthetic_rows(args.sections, args.lessons)))
+    # Прежняя раскладка индекса: словари строк по ключам маршрутов и множество id.
+    raw = _deep_size((
+        {(s['number'], s['slug']): s for s in sections},
+        {(l['section_id'], l['number'], l['slug']): l for l in lessons},
+        {('sections', s['id']) for s in sections} | {('lessons', l['id']) for l in lessons},
+    ))
+    compact = Catalog(sections, lessons).memory_usage()
+    print(f'Уроков: {args.lessons}, разделов: {args.sections}')
+    print(f'Словари PostgREST: {raw / args.lessons:8.1f} байт на урок ({raw / 1024:.0f} КБ)')
+    print(f"Компактный каталог: {compact['bytes_per_lesson']:8.1f} байт на урок ({compact['bytes'] / 1024:.0f} КБ)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
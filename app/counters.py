@@ -0,0 +1,51 @@
+﻿# Назначение файла:
+# Счётчики просмотров и времени на странице: агрегирование в памяти воркера и пакетный сброс дельт.
+
+# Импортируем системные инструменты.
+import os
+
+# Импортируем типы.
+from typing import Dict, List, Tuple
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import increment_page_counters, get_page_counters
+# Импортируем буфер счётчиков.
+from app.buffers import CounterBuffer, register_buffer
+
+# Период сброса счётчиков (сек.).
+COUNTERS_FLUSH_INTERVAL = float(os.getenv('COUNTERS_FLUSH_INTERVAL', '10'))
+# Максимальное время на странице, учитываемое за один просмотр (мс).
+MAX_TIME_ON_PAGE_MS = 30 * 60 * 1000
+
+# Допустимые типы страниц.
+COUNTER_KINDS = ('lesson', 'section')
+
+
+# Превращаем накопленные дельты в строки для пакетного upsert.
+def _flush_counters(deltas: Dict[Tuple[str, str], List[int]]) -> None:
+    rows = [
+        {'kind': kind, 'target_id': target_id, 'views': views, 'time_ms': time_ms}
+        for (kind, target_id), (views, time_ms) in deltas.items()
+    ]
+    increment_page_counters(rows)
+
+
+# Буфер счётчиков: (kind, target_id) -> [просмотры, время в мс].
+counters_buffer = register_buffer(CounterBuffer(
+    'page_counters',
+    _flush_counters,
+    width=2,
+    max_age=COUNTERS_FLUSH_INTERVAL,
+))
+
+# Учитываем просмотр страницы.
+def count_view(kind: str, target_id: str) -> None:
+    counters_buffer.add((kind, target_id), 1, 0)
+
+# Учитываем время на странице (из beacon-запроса).
+def count_time(kind: str, target_id: str, ms: int) -> None:
+    counters_buffer.add((kind, target_id), 0, max(0, min(ms, MAX_TIME_ON_PAGE_MS)))
+
+# Получаем счётчики страниц по id (для админки).
+def load_counters(kind: str, target_ids: List[str] | None = None) -> Dict[str, Dict[str, int]]:
+    return {row['target_id']: row for row in get_page_counters(kind, target_ids)}
@@ -0,0 +1,285 @@
+﻿# Назначение файла:
+# Потоковая генерация sitemap.xml и Atom-ленты уроков с кэшированием до следующего изменения контента.
+
+# Импортируем системные инструменты.
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+# Импортируем типы.
+from typing import Any, Callable, Dict, Iterator, List
+
+# Импортируем FastAPI компоненты.
+from fastapi import APIRouter, Request
+# Импортируем потоковый ответ.
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+# Импортируем запуск блокирующих функций в пуле потоков.
+from starlette.concurrency import run_in_threadpool
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import (
+    get_sections,
+    get_section_lesson_counts,
+    get_published_lessons_page,
+    get_recent_lessons,
+    on_content_write,
+)
+
+# Создаём роутер sitemap и ленты.
+feeds_router = APIRouter()
+
+# Лимит адресов в одном файле sitemap (протокол sitemaps.org).
+SITEMAP_MAX_URLS = 50000
+# Размер порции уроков при чтении из базы.
+SITEMAP_BATCH = 1000
+# Количество записей в Atom-ленте.
+FEED_SIZE = int(os.getenv('FEED_SIZE', '50'))
+# Публичный адрес сайта (если не задан — берём из запроса).
+SITE_URL = os.getenv('SITE_URL', '').rstrip('/')
+# Допустимые хосты сайта через запятую (если SITE_URL не задан); чужой Host заменяется первым из них.
+SITE_HOSTS = [host.strip().lower() for host in os.getenv('SITE_HOSTS', '').split(',') if host.strip()]
+# Максимальное число готовых ответов в кэше.
+FEED_CACHE_ENTRIES = int(os.getenv('FEED_CACHE_ENTRIES', '32'))
+# Метка базового адреса в кэшированных ответах: документ генерируется один раз для всех хостов,
+# а адрес подставляется при отдаче (символ NUL не встречается в текстовых полях PostgreSQL).
+BASE_URL_MARK = '\x00base_url\x00'
+# Допустимое имя хоста с необязательным портом.
+HOST_RE = re.compile(r'^[a-z0-9.-]{1,253}(:[0-9]{1,5})?$')
+# Заголовки кэширования для краулеров.
+FEED_CACHE_CONTROL = 'public, max-age=600'
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+# Кэш потоковых ответов: части ответа запоминаются по мере отдачи.
+class StreamCache:
+    def __init__(self, max_entries: int = FEED_CACHE_ENTRIES) -> None:
+        # Готовые ответы: ключ -> список частей (вытесняются самые старые).
+        self._entries: OrderedDict = OrderedDict()
+        self._max_entries = max_entries
+        # Общие данные для всех ответов (разделы, число адресов) в пределах поколения.
+        self._values: Dict[tuple, Any] = {}
+        # Поколение кэша: растёт при каждом изменении контента.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    # Сбрасываем кэш (подписчик на запись).
+    def invalidate(self, table: str | None = None, row_id: str | None = None) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._values.clear()
+
+    # Значение, вычисляемое один раз за поколение кэша.
+    def memo(self, key: tuple, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._values[key] = value
+        return value
+
+    # Отдаём ответ из кэша или генерируем его, одновременно сохраняя части.
+    # Метка BASE_URL_MARK в частях заменяется на base_url при отдаче.
+    def stream(self, key: tuple, produce: Callable[[], Iterator[str]], base_url: str = '') -> Iterator[bytes]:
+        mark = BASE_URL_MARK.encode('utf-8')
+        base = escape(base_url).encode('utf-8')
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            generation = self._generation
+        if cached is not None:
+            for data in cached:
+                yield data.replace(mark, base)
+            return
+        chunks: List[bytes] = []
+        for chunk in produce():
+            data = chunk.encode('utf-8')
+            chunks.append(data)
+            yield data.replace(mark, base)
+        # Не сохраняем ответ, если контент изменился во время генерации.
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = chunks
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+
+
+# Глобальный кэш sitemap и ленты.
+feed_cache = StreamCache()
+on_content_write(feed_cache.invalidate)
+
+
+# Определяем базовый адрес сайта: SITE_URL или хост запроса (проверенный и нормализованный),
+# чтобы произвольный заголовок Host не порождал новые записи кэша.
+def _base_url(request: Request) -> str:
+    if SITE_URL:
+        return SITE_URL
+    host = (request.headers.get('host') or '').strip().lower().rstrip('.')
+    if SITE_HOSTS:
+        if host not in SITE_HOSTS:
+            host = SITE_HOSTS[0]
+    elif not HOST_RE.match(host):
+        host = 'localhost'
+    scheme = 'https' if request.url.scheme == 'https' else 'http'
+    default_port = ':443' if scheme == 'https' else ':80'
+    if host.endswith(default_port):
+        host = host[:-len(default_port)]
+    return f'{scheme}://{host}'
+
+# Адрес страницы раздела.
+def _section_path(section: dict) -> str:
+    return f"/section-{section['number']}-{section['slug']}"
+
+# Адрес страницы урока.
+def _lesson_path(section: dict, lesson: dict) -> str:
+    return f"{_section_path(section)}/lesson-{lesson['number']}-{lesson['slug']}"
+
+# Выбираем самую позднюю из дат.
+def _latest(*values: str | None) -> str | None:
+    present = [value for value in values if value]
+    return max(present) if present else None
+
+# Элемент <url> карты сайта.
+def _url_entry(base_url: str, path: str, lastmod: str | None) -> str:
+    lastmod_tag = f'<lastmod>{escape(lastmod)}</lastmod>' if lastmod else ''
+    return f'<url><loc>{escape(base_url + path)}</loc>{lastmod_tag}</url>\n'
+
+# Загружаем разделы с датой последнего изменения их опубликованных уроков (один раз за поколение кэша).
+def _load_sections() -> Dict[str, dict]:
+    def compute() -> Dict[str, dict]:
+        counts = {row['section_id']: row for row in get_section_lesson_counts()}
+        sections = {}
+        for section in get_sections():
+            row = counts.get(section['id']) or {}
+            sections[section['id']] = dict(section, lastmod=_latest(section.get('updated_at'), row.get('published_updated_at')))
+        return sections
+
+    return feed_cache.memo(('sections',), compute)
+
+# Общее число адресов карты сайта: главная, разделы и опубликованные уроки.
+def _sitemap_total() -> int:
+    return feed_cache.memo(('total',), lambda: 1 + len(_load_sections()) + get_published_lessons_page(0, 1)['total'])
+
+# Число частей карты сайта.
+def _sitemap_parts() -> int:
+    return max(1, (_sitemap_total() + SITEMAP_MAX_URLS - 1) // SITEMAP_MAX_URLS)
+
+# Перебираем опубликованные уроки порциями, начиная с offset.
+def _iter_lessons(offset: int, limit: int) -> Iterator[dict]:
+    while limit > 0:
+        page = get_published_lessons_page(offset, min(SITEMAP_BATCH, limit))
+        if not page['items']:
+            return
+        yield from page['items']
+        offset += len(page['items'])
+        limit -= len(page['items'])
+
+# Генерируем одну карту сайта с адресами [start, start + SITEMAP_MAX_URLS).
+def _sitemap_chunks(base_url: str, sections: Dict[str, dict], start: int) -> Iterator[str]:
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n'
+    # Сначала идут главная страница и разделы, затем уроки.
+    head = [('/', _latest(*(s['lastmod'] for s in sections.values())))]
+    head += [(_section_path(s), s['lastmod']) for s in sorted(sections.values(), key=lambda s: s['number'])]
+    for path, lastmod in head[start:start + SITEMAP_MAX_URLS]:
+        yield _url_entry(base_url, path, lastmod)
+    lesson_offset = max(0, start - len(head))
+    lesson_limit = SITEMAP_MAX_URLS - len(head[start:start + SITEMAP_MAX_URLS])
+    for lesson in _iter_lessons(lesson_offset, lesson_limit):
+        section = sections.get(lesson['section_id'])
+        if section:
+            yield _url_entry(base_url, _lesson_path(section, lesson), lesson.get('updated_at'))
+    yield '</urlset>\n'
+
+# Генерируем индекс карт сайта.
+def _sitemap_index_chunks(base_url: str, sections: Dict[str, dict], total: int) -> Iterator[str]:
+    lastmod = _latest(*(s['lastmod'] for s in sections.values()))
+    lastmod_tag = f'<lastmod>{escape(lastmod)}</lastmod>' if lastmod else ''
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n'
+    for number in range((total + SITEMAP_MAX_URLS - 1) // SITEMAP_MAX_URLS):
+        yield f'<sitemap><loc>{escape(base_url)}/sitemap-{number + 1}.xml</loc>{lastmod_tag}</sitemap>\n'
+    yield '</sitemapindex>\n'
+
+# Ответ XML из кэша потоков.
+def _xml_response(key: tuple, produce: Callable[[], Iterator[str]], base_url: str, media_type: str = 'application/xml') -> StreamingResponse:
+    return StreamingResponse(
+        feed_cache.stream(key, produce, base_url),
+        media_type=media_type,
+        headers={'Cache-Control': FEED_CACHE_CONTROL},
+    )
+
+# Карта сайта (или индекс карт, если адресов больше лимита).
+@feeds_router.get('/sitemap.xml')
+async def sitemap(request: Request):
+    base_url = BASE_URL_MARK
+
+    def produce() -> Iterator[str]:
+        sections = _load_sections()
+        total = _sitemap_total()
+        if total <= SITEMAP_MAX_URLS:
+            yield from _sitemap_chunks(base_url, sections, 0)
+        else:
+            yield from _sitemap_index_chunks(base_url, sections, total)
+
+    return _xml_response(('sitemap',), produce, _base_url(request))
+
+# Часть карты сайта, на которую ссылается индекс.
+@feeds_router.get('/sitemap-{number}.xml')
+async def sitemap_part(request: Request, number: int):
+    base_url = BASE_URL_MARK
+    # Части вне диапазона не существуют (и не должны занимать кэш).
+    if not 1 <= number <= await run_in_threadpool(_sitemap_parts):
+        return Response(status_code=404)
+
+    def produce() -> Iterator[str]:
+        sections = _load_sections()
+        yield from _sitemap_chunks(base_url, sections, (number - 1) * SITEMAP_MAX_URLS)
+
+    return _xml_response(('sitemap', number), produce, _base_url(request))
+
+# Atom-лента недавно опубликованных и обновлённых уроков.
+@feeds_router.get('/feed.xml')
+async def atom_feed(request: Request):
+    base_url = BASE_URL_MARK
+
+    def produce() -> Iterator[str]:
+        sections = {section['id']: section for section in get_sections()}
+        lessons = [l for l in get_recent_lessons(FEED_SIZE) if l['section_id'] in sections]
+        # <updated> обязателен (RFC 4287): без уроков — по разделам или по времени генерации.
+        updated = (
+            _latest(*(lesson['updated_at'] for lesson in lessons))
+            or _latest(*(section.get('updated_at') for section in sections.values()))
+            or datetime.now(timezone.utc).isoformat(timespec='seconds')
+        )
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        yield '<title>Fast-API-Learn</title>\n<author><name>Fast-API-Learn</name></author>\n'
+        yield f'<id>{escape(base_url)}/</id>\n'
+        yield f'<link href="{escape(base_url)}/" />\n<link rel="self" href="{escape(base_url)}/feed.xml" />\n'
+        yield f'<updated>{escape(updated)}</updated>\n'
+        for lesson in lessons:
+            section = sections[lesson['section_id']]
+            url = base_url + _lesson_path(section, lesson)
+            yield (
+                '<entry>'
+                f"<title>Урок-{lesson['number']}-{escape(lesson['title'])}</title>"
+                f'<id>urn:uuid:{escape(lesson["id"])}</id>'
+                f'<link href="{escape(url)}" />'
+                f"<updated>{escape(lesson['updated_at'])}</updated>"
+                f"<summary>Раздел-{section['number']}-{escape(section['title'])}</summary>"
+                '</entry>\n'
+            )
+        yield '</feed>\n'
+
+    return _xml_response(('feed',), produce, _base_url(request), media_type='application/atom+xml')
+
+# robots.txt со ссылкой на карту сайта.
+@feeds_router.get('/robots.txt')
+async def robots_txt(request: Request):
+    return PlainTextResponse(f'User-agent: *\nDisallow: /bod\nSitemap: {_base_url(request)}/sitemap.xml\n')
@@ -0,0 +1,114 @@
+﻿# Назначение файла:
+# Кэш частей урока: теория для страницы урока и HTML-фрагменты (тесты, задачи),
+# которые подгружаются после первой отрисовки страницы.
+
+# Импортируем системные инструменты.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Импортируем типы.
+from typing import Any, Callable, Dict, Tuple
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import get_lesson_part, on_content_write
+# Импортируем снимок каталога на диске.
+from app.resilience import UpstreamUnavailable, snapshot_store
+# Импортируем индекс маршрутов (проверка, что урок существует и опубликован).
+from app.route_index import ROUTE_INDEX_TTL, route_index
+
+# Части урока, которые отдаются фрагментами.
+FRAGMENT_PARTS = ('tests', 'tasks')
+# Максимальное число фрагментов в кэше.
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '500'))
+# Время жизни записи (сек.): записи других воркеров сбрасывают кэш только у себя,
+# поэтому изменения доходят сюда не позже, чем индекс маршрутов.
+FRAGMENT_CACHE_TTL = float(os.getenv('FRAGMENT_CACHE_TTL', str(ROUTE_INDEX_TTL)))
+
+# Кэш: ключ -> (момент истечения, значение); (lesson_id, part) -> (updated_at, HTML) для фрагментов
+# и (lesson_id, 'theory') -> урок с теорией.
+_fragments: OrderedDict = OrderedDict()
+_fragments_lock = threading.Lock()
+
+
+# Сбрасываем фрагменты изменённого урока.
+@on_content_write
+def _invalidate_fragments(table: str, row_id: str | None) -> None:
+    if table != 'lessons':
+        return
+    with _fragments_lock:
+        if not row_id:
+            _fragments.clear()
+            return
+        for part in ('theory',) + FRAGMENT_PARTS:
+            _fragments.pop((row_id, part), None)
+
+# Запоминаем запись в кэше, вытесняя самые старые.
+def _remember(key: Tuple[str, str], entry: Any) -> None:
+    with _fragments_lock:
+        _fragments[key] = (time.monotonic() + FRAGMENT_CACHE_TTL, entry)
+        _fragments.move_to_end(key)
+        while len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+
+# Читаем непросроченную запись кэша или None.
+def _cached(key: Tuple[str, str]) -> Any:
+    with _fragments_lock:
+        cached = _fragments.get(key)
+        if cached is None:
+            return None
+        if cached[0] < time.monotonic():
+            del _fragments[key]
+            return None
+        _fragments.move_to_end(key)
+        return cached[1]
+
+# Получаем опубликованный урок с теорией или None.
+# offline — без обращения к базе: из кэша или снимка на диске.
+def get_lesson_theory(lesson_id: str, offline: bool = False) -> Dict[str, Any] | None:
+    # Неизвестные и неопубликованные id отсекаются по индексу, без обращения к базе и кэшу.
+    if route_index.published_lesson(lesson_id, offline) is None:
+        return None
+    key = (lesson_id, 'theory')
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+
+    if offline:
+        lesson = snapshot_store.load_lesson_part(lesson_id, 'theory')
+        if lesson is None:
+            raise UpstreamUnavailable(f'no snapshot for {lesson_id}')
+        return lesson if lesson.get('status') == 'published' else None
+
+    lesson = get_lesson_part(lesson_id, 'theory')
+    if not lesson or lesson.get('status') != 'published':
+        return None
+    snapshot_store.save_lesson_part(lesson, 'theory')
+    _remember(key, lesson)
+    return lesson
+
+# Получаем отрендеренный фрагмент урока: (updated_at, HTML) или None, если урок недоступен.
+# offline — без обращения к базе: из кэша или снимка на диске.
+def get_fragment(lesson_id: str, part: str, render: Callable[[dict], str], offline: bool = False) -> Tuple[str, bytes] | None:
+    # Неизвестные и неопубликованные id отсекаются по индексу, без обращения к базе и кэшу.
+    if route_index.published_lesson(lesson_id, offline) is None:
+        return None
+    key = (lesson_id, part)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+
+    if offline:
+        lesson = snapshot_store.load_lesson_part(lesson_id, part)
+        if lesson is None:
+            raise UpstreamUnavailable(f'no snapshot for {lesson_id}/{part}')
+        return lesson['updated_at'], render(lesson).encode('utf-8')
+
+    lesson = get_lesson_part(lesson_id, part)
+    if not lesson or lesson.get('status') != 'published':
+        return None
+    snapshot_store.save_lesson_part(lesson, part)
+    entry = (lesson['updated_at'], render(lesson).encode('utf-8'))
+    _remember(key, entry)
+    return entry
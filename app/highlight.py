@@ -0,0 +1,66 @@
+﻿# Назначение файла:
+# Подсветка блоков кода в HTML урока на сервере (Pygments): выполняется один раз при сохранении,
+# результат хранится в базе уже размеченным, поэтому страницам не нужен Prism.js.
+
+# Импортируем системные инструменты.
+import html
+import re
+from functools import lru_cache
+
+# Блок кода редактора: <pre><code class="language-X">...</code></pre>.
+CODE_BLOCK_RE = re.compile(
+    r'<pre(?:\s[^>]*)?>\s*<code(?P<attrs>\s[^>]*)?>(?P<body>.*?)</code>\s*</pre>',
+    re.DOTALL | re.IGNORECASE,
+)
+# Язык блока из класса language-X.
+LANGUAGE_RE = re.compile(r'class="[^"]*\blanguage-(?P<lang>[A-Za-z0-9_+-]+)')
+# Любой тег внутри блока (в том числе разметка прошлой подсветки).
+TAG_RE = re.compile(r'<[^>]+>')
+# Классы токенов Pygments (k, nf, s2, cpf, ...), которые пропускает очистка HTML.
+TOKEN_CLASS_RE = re.compile(r'^[a-z][a-z0-9]{0,2}$')
+# Класс контейнера подсвеченного блока (к нему привязаны стили токенов).
+HIGHLIGHT_CLASS = 'highlight'
+
+
+# Лексер по имени языка (неизвестный язык — без подсветки).
+@lru_cache(maxsize=32)
+def _lexer(language: str):
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        return get_lexer_by_name('text')
+
+# Форматтер: только <span class="..."> без обёрток.
+@lru_cache(maxsize=1)
+def _formatter():
+    from pygments.formatters import HtmlFormatter
+
+    return HtmlFormatter(nowrap=True)
+
+# Подсвечиваем один блок; исходный текст восстанавливаем из HTML, поэтому повторная подсветка даёт тот же результат.
+def _highlight_block(match: re.Match) -> str:
+    language_match = LANGUAGE_RE.search(match.group('attrs') or '')
+    if not language_match:
+        return match.group(0)
+    from pygments import highlight
+
+    language = language_match.group('lang').lower()
+    source = html.unescape(TAG_RE.sub('', match.group('body')))
+    body = highlight(source, _lexer(language), _formatter()).rstrip('\n')
+    return f'<pre class="{HIGHLIGHT_CLASS}"><code class="language-{language}">{body}</code></pre>'
+
+# Подсвечиваем все блоки кода с указанным языком в очищенном HTML.
+def highlight_code_blocks(html_text: str) -> str:
+    # Pygments импортируется только при сохранении урока с кодом.
+    if not html_text or '<code' not in html_text:
+        return html_text
+    return CODE_BLOCK_RE.sub(_highlight_block, html_text)
+
+# Фильтр атрибутов <span> для bleach: стиль и классы токенов подсветки.
+def allow_span_attr(tag: str, name: str, value: str) -> bool:
+    if name == 'style':
+        return True
+    return name == 'class' and all(TOKEN_CLASS_RE.match(part) for part in value.split())
@@ -0,0 +1,247 @@
+﻿# Назначение файла:
+# Раздача изображений уроков через /img/{path}: объект скачивается из Storage при первом обращении
+# и хранится в ограниченном по размеру LRU-кэше на локальном диске.
+
+# Импортируем системные инструменты.
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Импортируем FastAPI компоненты.
+from fastapi import APIRouter, Request
+# Импортируем ответы.
+from fastapi.responses import FileResponse, Response
+# Импортируем выполнение блокирующего кода в пуле потоков.
+from starlette.concurrency import run_in_threadpool
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import download_image
+
+# Создаём роутер изображений.
+images_router = APIRouter()
+
+# Каталог кэша изображений.
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fast-api-learn-images'))
+# Максимальный суммарный размер кэша (байт).
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Объекты по пути не меняются (имя = хэш содержимого), поэтому кэшируем их у клиента надолго.
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Изображения (в том числе SVG) отдаются с нашего домена, поэтому запрещаем в них скрипты.
+IMAGE_SECURITY_HEADERS = {
+    'Content-Security-Policy': "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+    'X-Content-Type-Options': 'nosniff',
+}
+
+# Сколько секунд помнить отсутствующий объект, чтобы не обращаться за ним в Storage повторно.
+IMAGE_MISS_TTL = float(os.getenv('IMAGE_MISS_TTL', '30'))
+# Максимальное число запомненных отсутствующих объектов.
+IMAGE_MISS_MAX = int(os.getenv('IMAGE_MISS_MAX', '1024'))
+# Попытки загрузить объект, если его вытеснили из кэша до отдачи.
+IMAGE_FETCH_ATTEMPTS = 3
+
+# Имена объектов: SHA-256 содержимого и расширение (см. image_object_name).
+IMAGE_NAME_RE = re.compile(r'^[0-9a-f]{64}\.\w+$', re.ASCII)
+# Тег <img> и его атрибуты в HTML урока.
+IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+IMG_SRC_RE = re.compile(r'\ssrc="[^"]*"')
+IMG_DATA_PATH_RE = re.compile(r'\sdata-path="([^"]+)"')
+
+
+# LRU-кэш файлов на диске: path -> размер файла.
+class DiskImageCache:
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Блокировки загрузки по пути: один запрос в Storage на объект.
+        self._fetch_locks: dict = {}
+        # Недавно не найденные объекты: name -> момент истечения.
+        self._missing: OrderedDict = OrderedDict()
+        # Файлы, которые сейчас отдаются клиентам: name -> число ответов (не вытесняются).
+        self._pins: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_found = 0
+
+    # Подхватываем файлы, оставшиеся от прошлого запуска.
+    def _load(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and IMAGE_NAME_RE.match(entry.name):
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+
+    # Удаляем самые давно использованные файлы, пока кэш больше лимита.
+    # Самый свежий файл и файлы, которые сейчас отдаются, не удаляются.
+    def _evict(self) -> None:
+        for name in list(self._entries)[:-1]:
+            if self._size <= self.max_bytes:
+                break
+            if name in self._pins:
+                continue
+            self._size -= self._entries.pop(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    # Путь к файлу в кэше, если объект уже скачан.
+    # pin=True — файл не вытесняется до вызова unpin (на время отдачи ответа).
+    def lookup(self, name: str, pin: bool = False) -> str | None:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            if pin:
+                self._pins[name] = self._pins.get(name, 0) + 1
+        return os.path.join(self.directory, name)
+
+    # Снимаем закрепление файла после отдачи ответа.
+    def unpin(self, name: str) -> None:
+        with self._lock:
+            count = self._pins.pop(name, 0) - 1
+            if count > 0:
+                self._pins[name] = count
+            self._evict()
+
+    # Объект недавно не нашёлся в Storage.
+    def _is_missing(self, name: str) -> bool:
+        with self._lock:
+            expires_at = self._missing.get(name)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._missing[name]
+                return False
+            self.not_found += 1
+            return True
+
+    # Запоминаем отсутствующий объект на IMAGE_MISS_TTL секунд.
+    def _remember_missing(self, name: str) -> None:
+        with self._lock:
+            self._missing[name] = time.monotonic() + IMAGE_MISS_TTL
+            self._missing.move_to_end(name)
+            while len(self._missing) > IMAGE_MISS_MAX:
+                self._missing.popitem(last=False)
+
+    # Скачиваем объект из Storage и сохраняем в кэш (блокирующий вызов).
+    # FileNotFoundError — объект недавно не нашёлся и Storage не опрашивается.
+    def fetch(self, name: str) -> str:
+        if self._is_missing(name):
+            raise FileNotFoundError(name)
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(name, threading.Lock())
+        with fetch_lock:
+            try:
+                cached = self.lookup(name)
+                if cached:
+                    return cached
+                if self._is_missing(name):
+                    raise FileNotFoundError(name)
+                try:
+                    data = download_image(name)
+                except Exception:
+                    self._remember_missing(name)
+                    raise
+                path = os.path.join(self.directory, name)
+                # Пишем во временный файл и атомарно переименовываем.
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+                with os.fdopen(fd, 'wb') as tmp:
+                    tmp.write(data)
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self.misses += 1
+                    self._entries[name] = len(data)
+                    self._size += len(data)
+                    self._evict()
+                return path
+            finally:
+                with self._lock:
+                    self._fetch_locks.pop(name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_found': self.not_found,
+            }
+
+
+# Глобальный кэш изображений.
+image_cache = DiskImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+
+# Переписываем src изображений урока на /img/{path} (по атрибуту data-path).
+def local_image_urls(html: str | None) -> str:
+    if not html or 'data-path' not in html:
+        return html or ''
+
+    def rewrite(match: re.Match) -> str:
+        tag = match.group(0)
+        path = IMG_DATA_PATH_RE.search(tag)
+        if not path or not IMAGE_NAME_RE.match(path.group(1)):
+            return tag
+        return IMG_SRC_RE.sub(f' src="/img/{path.group(1)}"', tag, count=1)
+
+    return IMG_TAG_RE.sub(rewrite, html)
+
+# Файл из кэша изображений: закреплён от вытеснения, пока ответ не отправлен.
+class CachedImageResponse(FileResponse):
+    def __init__(self, name: str, path: str, **kwargs) -> None:
+        super().__init__(path, **kwargs)
+        self.name = name
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            image_cache.unpin(self.name)
+
+
+# Изображение урока из локального кэша (поддерживает Range и условные запросы).
+@images_router.get('/img/{name}')
+async def lesson_image(request: Request, name: str):
+    if not IMAGE_NAME_RE.match(name):
+        return Response(status_code=404)
+
+    # Содержимое по имени не меняется, поэтому ETag — само имя объекта.
+    etag = f'"{name}"'
+    headers = {'ETag': etag, 'Cache-Control': IMAGE_CACHE_CONTROL, **IMAGE_SECURITY_HEADERS}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    # Закрепляем файл, чтобы параллельная загрузка не вытеснила его до отправки ответа.
+    path = await run_in_threadpool(image_cache.lookup, name, True)
+    for _ in range(IMAGE_FETCH_ATTEMPTS):
+        if path is not None:
+            break
+        try:
+            await run_in_threadpool(image_cache.fetch, name)
+        except Exception:
+            return Response(status_code=404)
+        # Файл мог быть вытеснен сразу после загрузки — берём его из кэша ещё раз.
+        path = await run_in_threadpool(image_cache.lookup, name, True)
+    if path is None:
+        return Response(status_code=503, headers={'Retry-After': '1'})
+
+    media_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return CachedImageResponse(name, path, media_type=media_type, headers=headers)
@@ -0,0 +1,88 @@
+﻿# Назначение файла:
+# Быстрая сериализация JSON для API: orjson (если установлен) с запасным вариантом на stdlib json,
+# потоковая отдача больших списков JSON-массивом или NDJSON.
+
+# Импортируем системные инструменты.
+import datetime
+import decimal
+import json
+import uuid
+
+# Импортируем типы.
+from typing import Any, Iterable, Iterator
+
+# Импортируем FastAPI компоненты.
+from fastapi import Request
+# Импортируем ответы.
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Импортируем orjson (необязательно: без него используется stdlib json).
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# MIME-тип NDJSON.
+NDJSON_TYPE = 'application/x-ndjson'
+# Размер порции потокового ответа (байт): меньше мелких отправок в сокет.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# Типы, которые stdlib json не умеет сериализовать.
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+# Сериализуем значение в компактный JSON (UTF-8 байты).
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        # orjson сам сериализует datetime и UUID.
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+# JSON-ответ API на быстром сериализаторе.
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Склеиваем мелкие части в порции размером около STREAM_CHUNK_SIZE.
+def _buffered(parts: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+# Потоковый JSON-массив: элементы сериализуются по одному, список целиком в памяти не собирается.
+def iter_json_array(items: Iterable[Any]) -> Iterator[bytes]:
+    def parts() -> Iterator[bytes]:
+        yield b'['
+        for index, item in enumerate(items):
+            if index:
+                yield b','
+            yield dumps(item)
+        yield b']'
+
+    return _buffered(parts())
+
+# Потоковый NDJSON: одна JSON-запись на строку.
+def iter_ndjson(items: Iterable[Any]) -> Iterator[bytes]:
+    return _buffered(dumps(item) + b'\n' for item in items)
+
+# Потоковый ответ со списком: NDJSON, если клиент просит его (Accept или ?format=ndjson), иначе JSON-массив.
+def streamed_list(request: Request, items: Iterable[Any]) -> StreamingResponse:
+    if request.query_params.get('format') == 'ndjson' or NDJSON_TYPE in request.headers.get('accept', ''):
+        return StreamingResponse(iter_ndjson(items), media_type=NDJSON_TYPE)
+    return StreamingResponse(iter_json_array(items), media_type='application/json')
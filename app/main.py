@@ -2,47 +2,98 @@
 # Главная точка входа FastAPI-приложения: конфигурация, маршруты, статика, обработчики ошибок.
 
 # Импортируем системные инструменты для работы с окружением.
-import os
+import asyncio
+from contextlib import asynccontextmanager
+
+# Импортируем загрузчик переменных окружения.
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения из .env (если файл существует) до импорта модулей приложения,
+# которые читают настройки при импорте.
+load_dotenv()
 
 # Импортируем FastAPI для создания веб-приложения.
 from fastapi import FastAPI, Request
-# Импортируем обработчик ошибок HTTP.
-from fastapi.responses import HTMLResponse
 # Импортируем поддержку статических файлов.
 from fastapi.staticfiles import StaticFiles
-# Импортируем шаблоны Jinja2.
-from fastapi.templating import Jinja2Templates
 # Импортируем middleware для cookie-сессий.
 from starlette.middleware.sessions import SessionMiddleware
-# Импортируем загрузчик переменных окружения.
-from dotenv import load_dotenv
 
+# Импортируем настройки cookie сессии.
+from app.admin_auth import SESSION_COOKIE, SESSION_MAX_AGE, SESSION_SECRET
 # Импортируем маршруты страниц.
-from app.routes import pages_router
+from app.routes import pages_router, not_found_response
 # Импортируем REST API.
 from app.rest import api_router
+# Импортируем sitemap и ленту.
+from app.feeds import feeds_router
+# Импортируем раздачу изображений из локального кэша.
+from app.images import images_router
+# Импортируем профилирование запросов по требованию.
+from app.profiling import ProfilingMiddleware, profiling_router
+# Импортируем контроль допуска запросов.
+from app.admission import AdmissionMiddleware, admission_router
+# Импортируем ранние подсказки для CSS и JS.
+from app.prefetch import EarlyHintsMiddleware
+# Импортируем фоновый сброс буферов отложенной записи.
+from app.buffers import run_flush_loop, flush_all
+# Импортируем прогрев зависимостей.
+from app.startup import STARTUP_MODE, WARMUP_DELAY, warm_up
 
-# Загружаем переменные окружения из .env (если файл существует).
-load_dotenv()
+# Прогрев в фоне: lifespan завершается сразу, и сервер открывает порт, не дожидаясь базы.
+async def deferred_warm_up() -> None:
+    await asyncio.sleep(WARMUP_DELAY)
+    await asyncio.to_thread(warm_up)
+
+# Жизненный цикл приложения: фоновые задачи и сброс буферов при остановке.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Прогреваем зависимости сразу или после открытия порта.
+    if STARTUP_MODE == 'eager':
+        await asyncio.to_thread(warm_up)
+        warm_up_task = None
+    else:
+        warm_up_task = asyncio.create_task(deferred_warm_up())
+    # Запускаем периодический сброс буферов.
+    flush_task = asyncio.create_task(run_flush_loop())
+    try:
+        yield
+    finally:
+        # Останавливаем цикл и сохраняем всё накопленное.
+        if warm_up_task:
+            warm_up_task.cancel()
+        flush_task.cancel()
+        await asyncio.to_thread(flush_all)
 
 # Создаём экземпляр FastAPI.
-app = FastAPI(title='Fast-API-Learn', version='1.0.0')
+app = FastAPI(title='Fast-API-Learn', version='1.0.0', lifespan=lifespan)
 
-# Готовим шаблонизатор для глобального использования (например, в 404).
-templates = Jinja2Templates(directory='templates')
+# Ранние подсказки (103 Early Hints, Link: preload) для style.css и app.js на HTML-страницах.
+app.add_middleware(EarlyHintsMiddleware)
+
+# Профилирование запросов (подключается до сессий, чтобы видеть сессию администратора).
+app.add_middleware(ProfilingMiddleware)
 
 # Подключаем middleware сессий для админки.
 app.add_middleware(
     SessionMiddleware,
-    secret_key=os.getenv('SESSION_SECRET', 'change_me_super_secret'),
-    max_age=60 * 60 * 24 * 30,  # 30 дней
+    secret_key=SESSION_SECRET,
+    session_cookie=SESSION_COOKIE,
+    max_age=SESSION_MAX_AGE,
     same_site='lax',
     https_only=False,
 )
 
-# Подключаем маршруты страниц и REST API.
+# Контроль допуска (внешний middleware: перегрузка отсекается до разбора сессии).
+app.add_middleware(AdmissionMiddleware)
+
+# Подключаем маршруты страниц, REST API, sitemap, ленту, изображения, профилирование и статистику допуска.
 app.include_router(pages_router)
 app.include_router(api_router)
+app.include_router(feeds_router)
+app.include_router(images_router)
+app.include_router(profiling_router)
+app.include_router(admission_router)
 
 # Подключаем статические файлы.
 app.mount('/static', StaticFiles(directory='static'), name='static')
@@ -50,5 +101,5 @@ app.mount('/static', StaticFiles(directory='static'), name='static')
 # Пользовательская страница 404.
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):
-    # Рендерим шаблон 404.
-    return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
+    # Отдаём заранее отрендеренную страницу 404 без обращений к базе.
+    return not_found_response(request)
@@ -2,7 +2,7 @@
 # Pydantic-схемы для валидации и сериализации данных.
 
 # Импортируем типы данных.
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Импортируем базовый класс моделей Pydantic.
 from pydantic import BaseModel, Field
@@ -66,3 +66,45 @@ class LessonIn(BaseModel):
     status: str
     # Контент урока.
     content: LessonContent
+
+# Схема попытки прохождения тестов урока.
+class AttemptIn(BaseModel):
+    # Выбранные варианты по порядку вопросов (None — без ответа).
+    answers: List[Optional[int]] = Field(..., max_length=500)
+
+# Схема beacon-запроса о времени на странице.
+class BeaconIn(BaseModel):
+    # Тип страницы: lesson или section.
+    kind: str
+    # Идентификатор урока или раздела.
+    id: str
+    # Время на странице в миллисекундах.
+    ms: int = Field(..., ge=0)
+    # Просмотр страницы, загруженной браузером заранее (сервер его не учитывал).
+    view: bool = False
+
+# Схема нового порядка разделов и уроков.
+class ReorderIn(BaseModel):
+    # Полный порядок разделов (None — не менять).
+    sections: Optional[List[str]] = None
+    # Полный порядок уроков по разделам: section_id -> список id уроков.
+    lessons: Dict[str, List[str]] = {}
+
+# Схема изображения, которое клиент хочет загрузить (по хэшу содержимого).
+class ImageRef(BaseModel):
+    # SHA-256 содержимого файла в hex.
+    sha256: str = Field(..., pattern=r'^[0-9a-f]{64}$')
+    # MIME-тип файла.
+    content_type: str
+
+# Схема поиска уже загруженных изображений.
+class ImageLookupIn(BaseModel):
+    # Изображения в порядке выбора пользователем.
+    images: List[ImageRef] = Field(..., max_length=50)
+
+# Схема включения профилирования запросов.
+class ProfilingIn(BaseModel):
+    # Регулярное выражение для пути запроса.
+    pattern: str = Field(..., min_length=1, max_length=200)
+    # Сколько следующих подходящих запросов профилировать.
+    count: int = Field(1, ge=1, le=100)
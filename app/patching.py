@@ -0,0 +1,179 @@
+﻿# Назначение файла:
+# Применение и построение частичных изменений JSON-документов: JSON Patch (RFC 6902) и JSON Merge Patch (RFC 7386).
+
+# Импортируем системные инструменты.
+import copy
+
+# Импортируем типы.
+from typing import Any, Dict, List
+
+# MIME-типы частичных изменений.
+JSON_PATCH_TYPE = 'application/json-patch+json'
+MERGE_PATCH_TYPE = 'application/merge-patch+json'
+
+
+# Ошибка применения патча.
+class PatchError(ValueError):
+    pass
+
+
+# Разбираем JSON Pointer (RFC 6901) на части пути.
+def _parse_pointer(pointer: str) -> List[str]:
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise PatchError(f'Некорректный путь: {pointer}')
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+# Преобразуем часть пути в индекс списка.
+def _list_index(container: list, part: str, allow_end: bool = False) -> int:
+    if part == '-' and allow_end:
+        return len(container)
+    if not part.isdigit() or (len(part) > 1 and part.startswith('0')):
+        raise PatchError(f'Некорректный индекс: {part}')
+    index = int(part)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise PatchError(f'Индекс вне диапазона: {part}')
+    return index
+
+# Находим родительский контейнер и последний ключ пути.
+def _resolve_parent(doc: Any, parts: List[str]):
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, dict):
+            if part not in target:
+                raise PatchError(f'Путь не найден: {part}')
+            target = target[part]
+        elif isinstance(target, list):
+            target = target[_list_index(target, part)]
+        else:
+            raise PatchError(f'Путь не найден: {part}')
+    return target, parts[-1]
+
+# Читаем значение по пути.
+def _get(doc: Any, parts: List[str]) -> Any:
+    if not parts:
+        return doc
+    parent, key = _resolve_parent(doc, parts)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise PatchError(f'Путь не найден: {key}')
+        return parent[key]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, key)]
+    raise PatchError(f'Путь не найден: {key}')
+
+# Добавляем значение по пути.
+def _add(doc: Any, parts: List[str], value: Any) -> Any:
+    if not parts:
+        return value
+    parent, key = _resolve_parent(doc, parts)
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, key, allow_end=True), value)
+    else:
+        raise PatchError(f'Путь не найден: {key}')
+    return doc
+
+# Удаляем значение по пути.
+def _remove(doc: Any, parts: List[str]) -> Any:
+    if not parts:
+        raise PatchError('Нельзя удалить корень документа.')
+    parent, key = _resolve_parent(doc, parts)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise PatchError(f'Путь не найден: {key}')
+        del parent[key]
+    elif isinstance(parent, list):
+        del parent[_list_index(parent, key)]
+    else:
+        raise PatchError(f'Путь не найден: {key}')
+    return doc
+
+# Заменяем существующее значение по пути.
+def _replace(doc: Any, parts: List[str], value: Any) -> Any:
+    if not parts:
+        return value
+    parent, key = _resolve_parent(doc, parts)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise PatchError(f'Путь не найден: {key}')
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent[_list_index(parent, key)] = value
+    else:
+        raise PatchError(f'Путь не найден: {key}')
+    return doc
+
+# Применяем JSON Patch (RFC 6902) к копии документа.
+def apply_json_patch(doc: Any, operations: List[Dict[str, Any]]) -> Any:
+    if not isinstance(operations, list):
+        raise PatchError('JSON Patch должен быть списком операций.')
+    result = copy.deepcopy(doc)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise PatchError('Операция должна содержать op и path.')
+        op = operation['op']
+        parts = _parse_pointer(operation['path'])
+        if op == 'add':
+            result = _add(result, parts, copy.deepcopy(operation.get('value')))
+        elif op == 'remove':
+            result = _remove(result, parts)
+        elif op == 'replace':
+            result = _replace(result, parts, copy.deepcopy(operation.get('value')))
+        elif op in ('move', 'copy'):
+            source = _parse_pointer(operation.get('from', ''))
+            value = copy.deepcopy(_get(result, source))
+            if op == 'move':
+                if parts[:len(source)] == source and len(parts) > len(source):
+                    raise PatchError('Нельзя переместить значение внутрь самого себя.')
+                result = _remove(result, source)
+            result = _add(result, parts, value)
+        elif op == 'test':
+            if _get(result, parts) != operation.get('value'):
+                raise PatchError(f'Проверка не пройдена: {operation["path"]}')
+        else:
+            raise PatchError(f'Неизвестная операция: {op}')
+    return result
+
+# Применяем JSON Merge Patch (RFC 7386) к копии документа.
+def apply_merge_patch(doc: Any, patch: Any) -> Any:
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(doc) if isinstance(doc, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+# Экранируем часть пути JSON Pointer.
+def _escape_pointer(part: Any) -> str:
+    return str(part).replace('~', '~0').replace('/', '~1')
+
+# Строим JSON Patch (RFC 6902), который превращает old в new.
+# Объекты и списки одинаковой длины сравниваются поэлементно, остальное заменяется целиком.
+def make_json_patch(old: Any, new: Any, path: str = '') -> List[Dict[str, Any]]:
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({'op': 'remove', 'path': f'{path}/{_escape_pointer(key)}'})
+        for key, value in new.items():
+            child = f'{path}/{_escape_pointer(key)}'
+            if key not in old:
+                operations.append({'op': 'add', 'path': child, 'value': copy.deepcopy(value)})
+            else:
+                operations.extend(make_json_patch(old[key], value, child))
+        return operations
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        operations = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            operations.extend(make_json_patch(old_item, new_item, f'{path}/{index}'))
+        return operations
+    return [{'op': 'replace', 'path': path, 'value': copy.deepcopy(new)}]
@@ -0,0 +1,101 @@
+﻿# Назначение файла:
+# Быстрые переходы между уроками: прогрев кэшей следующего урока в фоне, распознавание
+# предзагрузки браузером (prefetch/prerender) и ранние подсказки для CSS и JS (103 Early Hints, Link: preload).
+
+# Импортируем системные инструменты.
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Импортируем типы.
+from typing import Callable
+
+# Импортируем запрос и изменяемые заголовки.
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+
+# Импортируем кэш частей урока.
+from app.fragments import FRAGMENT_PARTS, get_fragment, get_lesson_theory
+# Импортируем предохранитель вызовов Supabase.
+from app.resilience import upstream_breaker
+
+logger = logging.getLogger(__name__)
+
+# Прогревать ли кэши следующего урока при показе текущего.
+PREFETCH_WARM = os.getenv('PREFETCH_WARM', '1') != '0'
+# Потоки прогрева: отдельный небольшой пул, чтобы прогрев не занимал пулы запросов и слоты допуска.
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))
+# Ресурсы, нужные каждой странице: браузер начинает их загрузку до получения HTML.
+PRELOAD_LINKS = (
+    '</static/css/style.css>; rel=preload; as=style',
+    '</static/js/app.js>; rel=preload; as=script',
+)
+# Адреса, которые не являются HTML-страницами.
+NON_PAGE_PREFIXES = ('/api/', '/static/', '/img/', '/lesson-fragments/')
+NON_PAGE_SUFFIXES = ('.xml', '.txt')
+
+_warm_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+# Уроки, прогрев которых уже запланирован.
+_warming: set = set()
+_warming_lock = threading.Lock()
+
+
+# Запрос отправлен браузером заранее (Speculation Rules, <link rel="prefetch">), а не переходом пользователя.
+def is_speculative(request: Request) -> bool:
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or request.headers.get('X-Moz') or ''
+    return 'prefetch' in purpose.lower()
+
+# Прогреваем теорию и фрагменты урока; ошибки прогрева не влияют на ответы.
+def _warm_lesson(lesson_id: str, render: Callable[[str, dict], str]) -> None:
+    try:
+        if upstream_breaker.is_open:
+            return
+        if get_lesson_theory(lesson_id) is None:
+            return
+        for part in FRAGMENT_PARTS:
+            get_fragment(lesson_id, part, partial(render, part))
+    except Exception:
+        logger.warning('Не удалось прогреть урок %s', lesson_id, exc_info=True)
+    finally:
+        with _warming_lock:
+            _warming.discard(lesson_id)
+
+# Планируем прогрев урока в фоне (повторные запросы того же урока объединяются).
+# render(part, lesson) рендерит фрагмент урока.
+def schedule_warm(lesson_id: str, render: Callable[[str, dict], str]) -> None:
+    if not PREFETCH_WARM:
+        return
+    with _warming_lock:
+        if lesson_id in _warming:
+            return
+        _warming.add(lesson_id)
+    _warm_executor.submit(_warm_lesson, lesson_id, render)
+
+
+# Ранние подсказки для HTML-страниц: 103 Early Hints, если сервер поддерживает расширение ASGI,
+# и заголовок Link: preload в ответе (прокси и CDN превращают его в 103 сами).
+class EarlyHintsMiddleware:
+    def __init__(self, app, links: tuple = PRELOAD_LINKS) -> None:
+        self.app = app
+        self.links = links
+        self.header = ', '.join(links)
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '') if scope['type'] == 'http' else ''
+        if scope['type'] != 'http' or scope['method'] != 'GET' or path.startswith(NON_PAGE_PREFIXES) or path.endswith(NON_PAGE_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        if 'http.response.early_hint' in scope.get('extensions', {}):
+            await send({'type': 'http.response.early_hint', 'links': [link.encode('latin-1') for link in self.links]})
+
+        async def send_with_links(message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                if headers.get('content-type', '').startswith('text/html'):
+                    headers.append('Link', self.header)
+            await send(message)
+
+        await self.app(scope, receive, send_with_links)
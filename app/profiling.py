@@ -0,0 +1,258 @@
+﻿# Назначение файла:
+# Профилирование запросов по требованию администратора: следующие N запросов по шаблону пути
+# или один запрос с флагом ?_profile=1. Семплирующий профилировщик pyinstrument (из requirements.txt),
+# отчёты в формате speedscope/HTML и разбивка времени: Supabase, sanitize_html, шаблоны.
+
+# Импортируем системные инструменты.
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+# Импортируем типы.
+from typing import Any, Dict
+
+# Импортируем FastAPI компоненты.
+from fastapi import APIRouter, Request, HTTPException
+# Импортируем ответы.
+from fastapi.responses import HTMLResponse, Response
+
+# Импортируем проверку админ-доступа.
+from app.admin_auth import require_admin
+# Импортируем быстрый JSON-ответ.
+from app.json_response import FastJSONResponse
+# Импортируем модель включения профилирования.
+from app.models import ProfilingIn
+# Импортируем проверку CSRF.
+from app.rest import ensure_csrf
+# Импортируем флаг выполнения вызовов Supabase в текущем потоке.
+from app.resilience import upstream_inline
+
+# Создаём роутер профилирования.
+profiling_router = APIRouter(prefix='/api/profiling')
+
+# Флаг профилирования одного запроса (только для администратора).
+PROFILE_QUERY_FLAG = b'_profile=1'
+# Интервал семплирования (сек.).
+PROFILE_INTERVAL = 0.001
+# Сколько последних отчётов хранить в памяти.
+PROFILE_REPORTS_KEEP = 20
+
+# Категории разбивки времени: признаки в пути файла или имени функции.
+BREAKDOWN_RULES = (
+    ('supabase', ('/supabase_client.py', '/supabase/', '/postgrest/', '/storage3/', '/supabase_auth/', '/httpx/', '/httpcore/')),
+    ('sanitize_html', ('/bleach/', 'sanitize_html')),
+    ('templates', ('/jinja2/', '/templates/')),
+)
+
+
+# Состояние профилирования воркера.
+class ProfilingState:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pattern: re.Pattern | None = None
+        self._remaining = 0
+        # Профилировщик может быть только один на поток, поэтому профилируем запросы по одному.
+        self._busy = False
+        self._ids = itertools.count(1)
+        self.reports: OrderedDict = OrderedDict()
+
+    # Включаем профилирование следующих count запросов.
+    def arm(self, pattern: str, count: int) -> None:
+        compiled = re.compile(pattern)
+        with self._lock:
+            self._pattern = compiled
+            self._remaining = count
+
+    def disarm(self) -> None:
+        with self._lock:
+            self._pattern = None
+            self._remaining = 0
+
+    @property
+    def armed(self) -> bool:
+        return self._remaining > 0
+
+    # Решаем, профилировать ли запрос, и занимаем профилировщик.
+    def acquire(self, path: str, forced: bool) -> bool:
+        with self._lock:
+            if self._busy:
+                return False
+            if not forced:
+                if not self._remaining or not self._pattern.search(path):
+                    return False
+                self._remaining -= 1
+            self._busy = True
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._busy = False
+
+    # Номер следующего отчёта.
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    # Сохраняем отчёт, вытесняя старые.
+    def store(self, report_id: int, report: Dict[str, Any]) -> None:
+        with self._lock:
+            self.reports[report_id] = report
+            while len(self.reports) > PROFILE_REPORTS_KEEP:
+                self.reports.popitem(last=False)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pattern': self._pattern.pattern if self._pattern else None,
+                'remaining': self._remaining,
+                'reports': [
+                    {'id': report_id, **{k: v for k, v in report.items() if k != 'session'}}
+                    for report_id, report in reversed(self.reports.items())
+                ],
+            }
+
+
+# Глобальное состояние профилирования.
+profiling_state = ProfilingState()
+
+
+# Класс профилировщика или None, если pyinstrument не установлен (результат импорта запоминается).
+@lru_cache(maxsize=1)
+def _profiler_class():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler
+
+# Категория кадра по пути файла и имени функции.
+def _category(frame) -> str | None:
+    location = f'{frame.file_path or ""}:{frame.function or ""}'.replace('\\', '/')
+    for category, markers in BREAKDOWN_RULES:
+        if any(marker in location for marker in markers):
+            return category
+    return None
+
+# Разбивка времени по категориям: учитываем только внешний кадр каждой категории.
+def breakdown(root) -> Dict[str, float]:
+    totals = {category: 0.0 for category, _ in BREAKDOWN_RULES}
+    stack = [(root, frozenset())]
+    while stack:
+        frame, seen = stack.pop()
+        category = _category(frame)
+        if category and category not in seen:
+            totals[category] += frame.time
+            seen = seen | {category}
+        stack.extend((child, seen) for child in frame.children)
+    total = root.time if root else 0.0
+    totals['other'] = max(0.0, total - sum(totals.values()))
+    return {category: round(seconds * 1000, 2) for category, seconds in totals.items()}
+
+
+# ASGI-middleware: без включённого профилирования — одна проверка флага и подстроки в query string.
+class ProfilingMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not (profiling_state.armed or PROFILE_QUERY_FLAG in scope['query_string']):
+            await self.app(scope, receive, send)
+            return
+
+        # Флаг в запросе действует только для администратора (сессия разбирается внешним middleware).
+        forced = PROFILE_QUERY_FLAG in scope['query_string'] and bool(scope.get('session', {}).get('is_admin'))
+        Profiler = _profiler_class()
+        if Profiler is None or not profiling_state.acquire(scope['path'], forced):
+            await self.app(scope, receive, send)
+            return
+
+        report_id = profiling_state.next_id()
+        report_url = f'/api/profiling/reports/{report_id}'.encode()
+        status_code = 0
+
+        # Запоминаем статус и добавляем ссылку на отчёт в заголовки ответа.
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                message['headers'] = [*message.get('headers', []), (b'x-profile-report', report_url)]
+            await send(message)
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode='enabled')
+        # Вызовы Supabase выполняются в этом же потоке, иначе семплирующий профилировщик их не увидит.
+        token = upstream_inline.set(True)
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            upstream_inline.reset(token)
+            profiling_state.release()
+            session = profiler.last_session
+            root = session.root_frame() if session else None
+            profiling_state.store(report_id, {
+                'method': scope['method'],
+                'path': scope['path'],
+                'status': status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'breakdown': breakdown(root) if root else {},
+                'session': session,
+            })
+
+
+# Проверяем, что профилировщик установлен.
+def _require_profiler() -> None:
+    if _profiler_class() is None:
+        raise HTTPException(status_code=501, detail='Профилирование недоступно: установите pyinstrument.')
+
+# Состояние профилирования и список отчётов.
+@profiling_router.get('')
+async def profiling_status(request: Request):
+    require_admin(request)
+    return FastJSONResponse({'available': _profiler_class() is not None, **profiling_state.status()})
+
+# Включаем профилирование следующих N запросов, путь которых подходит под шаблон.
+@profiling_router.post('')
+async def profiling_arm(request: Request, payload: ProfilingIn):
+    require_admin(request)
+    ensure_csrf(request)
+    _require_profiler()
+    try:
+        profiling_state.arm(payload.pattern, payload.count)
+    except re.error as exc:
+        raise HTTPException(status_code=400, detail=f'Некорректный шаблон: {exc}')
+    return FastJSONResponse(profiling_state.status())
+
+# Выключаем профилирование.
+@profiling_router.delete('')
+async def profiling_disarm(request: Request):
+    require_admin(request)
+    ensure_csrf(request)
+    profiling_state.disarm()
+    return Response(status_code=204)
+
+# Отчёт: speedscope (по умолчанию), html или json (только разбивка).
+@profiling_router.get('/reports/{report_id}')
+async def profiling_report(request: Request, report_id: int, format: str = 'speedscope'):
+    require_admin(request)
+    report = profiling_state.reports.get(report_id)
+    if not report:
+        raise HTTPException(status_code=404, detail='Отчёт не найден')
+    summary = {k: v for k, v in report.items() if k != 'session'}
+    if format == 'json' or report['session'] is None:
+        return FastJSONResponse(summary)
+    if format == 'html':
+        from pyinstrument.renderers import HTMLRenderer
+        return HTMLResponse(HTMLRenderer().render(report['session']))
+    if format == 'speedscope':
+        from pyinstrument.renderers import SpeedscopeRenderer
+        return Response(
+            SpeedscopeRenderer().render(report['session']),
+            media_type='application/json',
+            headers={'Content-Disposition': f'attachment; filename="profile-{report_id}.speedscope.json"'},
+        )
+    raise HTTPException(status_code=400, detail='Формат: speedscope, html или json.')
@@ -0,0 +1,243 @@
+﻿# Назначение файла:
+# Устойчивость публичных страниц к сбоям Supabase: дедлайны вызовов, предохранитель (circuit breaker)
+# и сохранённый на диске снимок каталога, который отдаётся, пока предохранитель разомкнут.
+
+# Импортируем системные инструменты.
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Импортируем типы.
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько неудачных или медленных вызовов подряд размыкают предохранитель.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+# Вызов дольше этого порога (сек.) считается медленным.
+BREAKER_SLOW_CALL = float(os.getenv('BREAKER_SLOW_CALL', '2'))
+# Через сколько секунд разомкнутый предохранитель пропускает пробный вызов.
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '15'))
+# Число потоков для вызовов Supabase из публичных страниц.
+UPSTREAM_WORKERS = int(os.getenv('UPSTREAM_WORKERS', '16'))
+# Каталог снимка каталога.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'fast-api-learn-snapshot'))
+
+# Дедлайны маршрутов (сек.).
+ROUTE_DEADLINES = {
+    'index': float(os.getenv('DEADLINE_INDEX', '2')),
+    'section': float(os.getenv('DEADLINE_SECTION', '2')),
+    'lesson': float(os.getenv('DEADLINE_LESSON', '3')),
+    'fragment': float(os.getenv('DEADLINE_FRAGMENT', '3')),
+}
+
+
+# Supabase недоступен: дедлайн истёк, вызов упал или предохранитель разомкнут.
+class UpstreamUnavailable(Exception):
+    pass
+
+
+# Предохранитель: closed -> open после серии сбоев -> half_open после паузы -> closed после успеха.
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, slow_call: float, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        # Пробный вызов в состоянии half_open уже выполняется.
+        self._probing = False
+        # Счётчики для диагностики.
+        self.rejected = 0
+        self.trips = 0
+
+    # Можно ли выполнять вызов сейчас.
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+                self._probing = False
+            if self._state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    # Учитываем результат вызова.
+    def record(self, ok: bool, elapsed: float) -> None:
+        with self._lock:
+            self._probing = False
+            if ok and elapsed < self.slow_call:
+                self._state = 'closed'
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.trips += 1
+                    logger.warning('Предохранитель %s разомкнут после %d сбоев', self.name, self._failures)
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    # Вызов завершился без вывода о здоровье Supabase: освобождаем пробный слот, не меняя состояние.
+    def release(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._state == 'open'
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+# Предохранитель вызовов Supabase.
+upstream_breaker = CircuitBreaker('supabase', BREAKER_FAILURE_THRESHOLD, BREAKER_SLOW_CALL, BREAKER_RESET_TIMEOUT)
+# Выполнять вызовы в текущем потоке без дедлайна (при профилировании запроса).
+upstream_inline: contextvars.ContextVar[bool] = contextvars.ContextVar('upstream_inline', default=False)
+# Отдельный пул: зависшие вызовы не занимают пул потоков Starlette и не задерживают ответ после дедлайна.
+_upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream')
+
+
+# Классы SQLSTATE и коды PostgREST, которые вызваны самим запросом (неверный uuid, нарушение ограничения и т. п.).
+CLIENT_ERROR_CODES = ('22', '23', '42', 'PGRST1')
+
+
+# Ошибка PostgREST вызвана запросом клиента (4xx), а не состоянием Supabase.
+def is_client_error(exc: BaseException) -> bool:
+    if type(exc).__name__ != 'APIError' or not type(exc).__module__.startswith('postgrest'):
+        return False
+    code = str(getattr(exc, 'code', '') or '')
+    # Трёхзначный код — HTTP-статус ответа без JSON; пятизначный (23503, 42501) — SQLSTATE.
+    if len(code) == 3 and code.isdigit():
+        return 400 <= int(code) < 500
+    return code.startswith(CLIENT_ERROR_CODES)
+
+# Сбой Supabase: дедлайн, сетевая ошибка, 5xx или явная недоступность.
+def is_upstream_failure(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError, UpstreamUnavailable)):
+        return True
+    if type(exc).__name__ == 'APIError':
+        return not is_client_error(exc)
+    # Сетевые ошибки httpx (клиент Supabase) наследуются от TransportError.
+    return any(cls.__name__ == 'TransportError' and cls.__module__.startswith('httpx') for cls in type(exc).__mro__)
+
+
+# Выполняем блокирующую функцию доступа к Supabase с дедлайном маршрута через предохранитель.
+# Ошибки запроса (4xx PostgREST) считаются ответом «не найдено» и возвращают None,
+# прочие ошибки кода пробрасываются как есть; на предохранитель влияют только сбои Supabase.
+async def call_upstream(route: str, fn: Callable, *args: Any) -> Any:
+    if upstream_inline.get():
+        try:
+            return fn(*args)
+        except Exception as exc:
+            if is_client_error(exc):
+                return None
+            raise
+    if not upstream_breaker.allow():
+        raise UpstreamUnavailable('circuit open')
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    future = loop.run_in_executor(_upstream_executor, fn, *args)
+    try:
+        result = await asyncio.wait_for(future, timeout=ROUTE_DEADLINES[route])
+    except Exception as exc:
+        if is_upstream_failure(exc):
+            upstream_breaker.record(False, time.monotonic() - started)
+            raise UpstreamUnavailable(f'{route}: {exc!r}') from exc
+        upstream_breaker.release()
+        if is_client_error(exc):
+            return None
+        raise
+    upstream_breaker.record(True, time.monotonic() - started)
+    return result
+
+
+# Снимок каталога на диске: catalog.json (разделы и уроки без контента) и отдельные части уроков.
+class SnapshotStore:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Что уже записано: не переписываем файлы без изменений.
+        self._catalog_written: Tuple | None = None
+        self._parts_written: Dict[Tuple[str, str], str] = {}
+
+    # Атомарная запись JSON-файла.
+    def _write(self, name: str, data: Any) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
+            json.dump(data, tmp, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def _read(self, name: str) -> Any:
+        try:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Сохраняем каталог после успешного обновления индекса маршрутов.
+    def save_catalog(self, sections: List[Dict[str, Any]], lessons: List[Dict[str, Any]]) -> None:
+        marker = (
+            tuple((s['id'], s.get('updated_at')) for s in sections),
+            tuple((l['id'], l.get('updated_at'), l.get('number'), l.get('status')) for l in lessons),
+        )
+        with self._lock:
+            if marker == self._catalog_written:
+                return
+            try:
+                self._write('catalog.json', {'sections': sections, 'lessons': lessons})
+            except OSError:
+                logger.exception('Не удалось сохранить снимок каталога')
+                return
+            self._catalog_written = marker
+
+    # Читаем каталог: (разделы, уроки) или None, если снимка нет.
+    def load_catalog(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | None:
+        data = self._read('catalog.json')
+        if not data:
+            return None
+        return data['sections'], data['lessons']
+
+    # Сохраняем часть опубликованного урока (теорию, тесты или задачи).
+    def save_lesson_part(self, lesson: Dict[str, Any], part: str) -> None:
+        key = (lesson['id'], part)
+        with self._lock:
+            if self._parts_written.get(key) == lesson.get('updated_at'):
+                return
+            try:
+                self._write(f"lesson-{lesson['id']}-{part}.json", lesson)
+            except OSError:
+                logger.exception('Не удалось сохранить снимок урока %s', lesson['id'])
+                return
+            self._parts_written[key] = lesson.get('updated_at')
+
+    # Читаем часть урока из снимка.
+    def load_lesson_part(self, lesson_id: str, part: str) -> Dict[str, Any] | None:
+        if not lesson_id.replace('-', '').isalnum():
+            return None
+        return self._read(f'lesson-{lesson_id}-{part}.json')
+
+
+# Глобальный снимок каталога.
+snapshot_store = SnapshotStore(SNAPSHOT_DIR)
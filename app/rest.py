@@ -2,41 +2,87 @@
 # REST API для CRUD-операций с разделами и уроками, загрузки изображений и валидации.
 
 # Импортируем системные инструменты.
+import asyncio
+import copy
+import json
+import logging
+import os
 import re
 
+# Импортируем типы.
+from typing import Any, Dict, List
+
 # Импортируем FastAPI компоненты.
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException
+from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Query
 # Импортируем ответы JSON.
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
+# Импортируем запуск блокирующих функций в пуле потоков.
+from starlette.concurrency import run_in_threadpool
+
+# Импортируем ошибку валидации Pydantic.
+from pydantic import ValidationError
 
-# Импортируем библиотеку для очистки HTML.
-import bleach
+# Импортируем быстрый JSON-ответ и потоковую отдачу списков.
+from app.json_response import FastJSONResponse, dumps, streamed_list
 
 # Импортируем модели для валидации.
-from app.models import SectionIn, LessonIn
+from app.models import SectionIn, LessonIn, AttemptIn, BeaconIn, ReorderIn, ImageLookupIn
 # Импортируем функции Supabase.
 from app.supabase_client import (
     get_sections,
-    get_lessons,
+    iter_lessons,
     get_lesson_by_id,
     create_section,
     update_section,
     delete_section,
     create_lesson,
     update_lesson,
+    update_lesson_if_unmodified,
     delete_lesson,
     upload_image,
+    find_image,
+    IMAGE_EXTENSIONS,
     extract_image_paths,
+    get_attempt_question_stats,
+    get_attempt_summary,
+    get_section_lessons_page,
+    reorder_catalog,
 )
 # Импортируем функции безопасности.
 from app.admin_auth import require_admin, verify_csrf_token
+# Импортируем применение частичных изменений.
+from app.patching import JSON_PATCH_TYPE, PatchError, apply_json_patch, apply_merge_patch
+# Импортируем проверку тестов.
+from app.attempts import get_answer_key, grade, record_attempt
+# Импортируем счётчики просмотров.
+from app.counters import COUNTER_KINDS, count_time, count_view, load_counters
+# Импортируем индекс маршрутов.
+from app.route_index import route_index
+# Импортируем серверную подсветку кода.
+from app.highlight import allow_span_attr, highlight_code_blocks
+# Импортируем историю изменений уроков.
+from app.revisions import RevisionNotFound, diff_revisions, list_revisions, load_revision, record_revision_safely
+
+logger = logging.getLogger(__name__)
 
 # Создаём роутер API.
-api_router = APIRouter(prefix='/api')
+api_router = APIRouter(prefix='/api', default_response_class=FastJSONResponse)
 
 # Регулярное выражение для slug.
 SLUG_RE = re.compile(r'^[a-z]+(-[a-z]+)*$')
 
+# Допустимые поля сортировки и статусы для списка уроков.
+LESSON_SORT_FIELDS = ('number', 'title', 'updated_at')
+LESSON_STATUSES = ('draft', 'published')
+# Максимальный размер страницы списка уроков.
+MAX_PAGE_SIZE = 100
+
+# Ограничения загрузки изображений.
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+MAX_BATCH_FILES = 50
+# Число одновременных загрузок в Storage в рамках одного пакета.
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+
 # Настройки очистки HTML от XSS.
 ALLOWED_TAGS = [
     'p', 'br', 'strong', 'em', 'u', 's', 'span',
@@ -49,7 +95,7 @@ ALLOWED_TAGS = [
 ALLOWED_ATTRS = {
     'a': ['href', 'title', 'target', 'rel'],
     'img': ['src', 'alt', 'title', 'data-path'],
-    'span': ['style'],
+    'span': allow_span_attr,
     'p': ['style'],
     'code': ['class'],
     'pre': ['class'],
@@ -59,6 +105,9 @@ ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
 
 # Очистка HTML.
 def sanitize_html(html: str) -> str:
+    # bleach импортируется при первом сохранении, а не при старте приложения.
+    import bleach
+
     # Очищаем HTML, удаляя опасные теги/атрибуты.
     return bleach.clean(
         html or '',
@@ -68,12 +117,99 @@ def sanitize_html(html: str) -> str:
         strip=True,
     )
 
+# Очистка HTML теории и задач с подсветкой блоков кода (результат хранится в базе).
+def render_lesson_html(html: str) -> str:
+    return highlight_code_blocks(sanitize_html(html))
+
 # Проверяем валидность slug.
 def validate_slug(slug: str) -> None:
     # Проверяем регулярное выражение.
     if not SLUG_RE.match(slug or ''):
         raise HTTPException(status_code=400, detail='Slug должен содержать только строчные буквы и дефисы.')
 
+# Очищаем HTML всех фрагментов урока и собираем пути изображений.
+def prepare_lesson_content(content: Dict[str, Any]) -> Dict[str, Any]:
+    # Очищаем теорию.
+    theory_html = render_lesson_html(content.get('theory', {}).get('html', ''))
+    if content.get('theory'):
+        content['theory']['images'] = extract_image_paths(theory_html)
+        content['theory']['html'] = theory_html
+
+    # Перезаписываем очищенные HTML задач.
+    for task in content.get('tasks') or []:
+        task['html'] = render_lesson_html(task.get('html', ''))
+
+    # Собираем пути изображений из HTML.
+    task_html = ' '.join([t.get('html', '') for t in content.get('tasks') or []])
+    content['images'] = list(set(extract_image_paths(theory_html) + extract_image_paths(task_html)))
+    return content
+
+# Сливаем новый контент с сохранённым: очищаем и индексируем только изменённые фрагменты.
+def merge_lesson_content(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    content = copy.deepcopy(new)
+    touched = False
+
+    # Теория: сохранённый HTML уже очищен, поэтому сравниваем с ним напрямую.
+    old_theory = old.get('theory') or {}
+    theory = content.setdefault('theory', {})
+    if theory.get('html', '') != old_theory.get('html', ''):
+        theory['html'] = render_lesson_html(theory.get('html', ''))
+        theory['images'] = extract_image_paths(theory['html'])
+        touched = True
+    else:
+        theory['images'] = old_theory.get('images') or []
+
+    # Задачи: очищаем только изменённые и новые.
+    old_tasks = old.get('tasks') or []
+    tasks = content.get('tasks') or []
+    for index, task in enumerate(tasks):
+        old_task = old_tasks[index] if index < len(old_tasks) else {}
+        if task.get('html', '') != old_task.get('html', ''):
+            task['html'] = render_lesson_html(task.get('html', ''))
+            touched = True
+    touched = touched or len(tasks) != len(old_tasks)
+
+    # Тесты: очищаем только изменённые вопросы и варианты.
+    old_tests = old.get('tests') or []
+    tests = content.get('tests') or []
+    for index, test in enumerate(tests):
+        old_test = old_tests[index] if index < len(old_tests) else {}
+        if test.get('question', '') != old_test.get('question', ''):
+            test['question'] = sanitize_html(test.get('question', ''))
+            touched = True
+        if test.get('options') != old_test.get('options'):
+            test['options'] = [sanitize_html(option or '') for option in test.get('options') or []]
+            touched = True
+    touched = touched or len(tests) != len(old_tests)
+
+    # Пересобираем общий список изображений, только если менялся HTML.
+    if touched:
+        fragments = [theory['html']] + [t.get('html', '') for t in tasks] + [t.get('question', '') for t in tests]
+        content['images'] = sorted(set(extract_image_paths(' '.join(fragments))))
+    else:
+        content['images'] = old.get('images') or []
+    return content
+
+# Сравниваем урок с сохранённым и возвращаем только изменённые колонки.
+def diff_lesson(current: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    changes = {
+        field: incoming[field]
+        for field in ('section_id', 'number', 'title', 'slug', 'status')
+        if incoming[field] != current.get(field)
+    }
+    old_content = current.get('content') or {}
+    content = merge_lesson_content(old_content, incoming['content'])
+    if content != old_content:
+        changes['content'] = content
+    return changes
+
+# Достаём значение If-Match (без кавычек и признака W/).
+def parse_if_match(request: Request) -> str | None:
+    value = (request.headers.get('If-Match') or '').strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    return value.strip('"') or None
+
 # Проверяем CSRF для опасных методов.
 def ensure_csrf(request: Request):
     # Достаём токен из заголовка.
@@ -94,7 +230,7 @@ async def api_create_section(request: Request, payload: SectionIn):
 
     # Создаём раздел.
     created = create_section(payload.model_dump())
-    return JSONResponse(created)
+    return FastJSONResponse(created)
 
 # Обновление раздела.
 @api_router.put('/sections/{section_id}')
@@ -108,7 +244,7 @@ async def api_update_section(request: Request, section_id: str, payload: Section
 
     # Обновляем раздел.
     updated = update_section(section_id, payload.model_dump())
-    return JSONResponse(updated)
+    return FastJSONResponse(updated)
 
 # Удаление раздела.
 @api_router.delete('/sections/{section_id}')
@@ -120,7 +256,24 @@ async def api_delete_section(request: Request, section_id: str):
 
     # Удаляем раздел.
     delete_section(section_id)
-    return JSONResponse({'status': 'ok'})
+    return FastJSONResponse({'status': 'ok'})
+
+# Изменение порядка разделов и/или уроков одним запросом.
+@api_router.put('/reorder')
+async def api_reorder(request: Request, payload: ReorderIn):
+    # Проверяем админ-доступ.
+    require_admin(request)
+    # Проверяем CSRF.
+    ensure_csrf(request)
+    if payload.sections is None and not payload.lessons:
+        raise HTTPException(status_code=400, detail='Порядок не передан.')
+
+    # Применяем порядок атомарно на стороне базы.
+    try:
+        reorder_catalog(payload.sections, payload.lessons)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse({'status': 'ok'})
 
 # Создание урока.
 @api_router.post('/lessons')
@@ -132,20 +285,8 @@ async def api_create_lesson(request: Request, payload: LessonIn):
     # Валидируем slug.
     validate_slug(payload.slug)
 
-    # Собираем пути изображений из HTML.
-    content = payload.content.model_dump()
-    theory_html = sanitize_html(content.get('theory', {}).get('html', ''))
-    tasks = content.get('tasks') or []
-    task_html = ' '.join([sanitize_html(t.get('html', '')) for t in tasks])
-    image_paths = list(set(extract_image_paths(theory_html) + extract_image_paths(task_html)))
-    content['images'] = image_paths
-    if content.get('theory'):
-        content['theory']['images'] = extract_image_paths(theory_html)
-        content['theory']['html'] = theory_html
-
-    # Перезаписываем очищенные HTML задач.
-    for task in content.get('tasks') or []:
-        task['html'] = sanitize_html(task.get('html', ''))
+    # Очищаем HTML и собираем пути изображений.
+    content = prepare_lesson_content(payload.content.model_dump())
 
     # Создаём урок.
     created = create_lesson({
@@ -156,7 +297,8 @@ async def api_create_lesson(request: Request, payload: LessonIn):
         'status': payload.status,
         'content': content,
     })
-    return JSONResponse(created)
+    record_revision_safely(created)
+    return FastJSONResponse(created)
 
 # Обновление урока.
 @api_router.put('/lessons/{lesson_id}')
@@ -168,20 +310,8 @@ async def api_update_lesson(request: Request, lesson_id: str, payload: LessonIn)
     # Валидируем slug.
     validate_slug(payload.slug)
 
-    # Собираем пути изображений из HTML.
-    content = payload.content.model_dump()
-    theory_html = sanitize_html(content.get('theory', {}).get('html', ''))
-    tasks = content.get('tasks') or []
-    task_html = ' '.join([sanitize_html(t.get('html', '')) for t in tasks])
-    image_paths = list(set(extract_image_paths(theory_html) + extract_image_paths(task_html)))
-    content['images'] = image_paths
-    if content.get('theory'):
-        content['theory']['images'] = extract_image_paths(theory_html)
-        content['theory']['html'] = theory_html
-
-    # Перезаписываем очищенные HTML задач.
-    for task in content.get('tasks') or []:
-        task['html'] = sanitize_html(task.get('html', ''))
+    # Очищаем HTML и собираем пути изображений.
+    content = prepare_lesson_content(payload.content.model_dump())
 
     # Обновляем урок.
     updated = update_lesson(lesson_id, {
@@ -192,7 +322,99 @@ async def api_update_lesson(request: Request, lesson_id: str, payload: LessonIn)
         'status': payload.status,
         'content': content,
     })
-    return JSONResponse(updated)
+    record_revision_safely(updated)
+    return FastJSONResponse(updated)
+
+# Частичное обновление урока (JSON Patch или JSON Merge Patch).
+@api_router.patch('/lessons/{lesson_id}')
+async def api_patch_lesson(request: Request, lesson_id: str):
+    # Проверяем админ-доступ.
+    require_admin(request)
+    # Проверяем CSRF.
+    ensure_csrf(request)
+
+    # Требуем версию, на основе которой сделаны изменения.
+    expected = parse_if_match(request)
+    if not expected:
+        raise HTTPException(status_code=428, detail='Требуется заголовок If-Match.')
+
+    lesson = get_lesson_by_id(lesson_id)
+    if not lesson:
+        raise HTTPException(status_code=404, detail='Lesson not found')
+    if lesson.get('updated_at') != expected:
+        raise HTTPException(status_code=412, detail='Урок был изменён, обновите страницу.')
+
+    # Применяем патч к документу урока.
+    try:
+        patch = json.loads(await request.body() or b'null')
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Некорректный JSON.')
+    document = {field: lesson.get(field) for field in LessonIn.model_fields}
+    try:
+        if request.headers.get('Content-Type', '').split(';')[0].strip() == JSON_PATCH_TYPE:
+            document = apply_json_patch(document, patch)
+        else:
+            document = apply_merge_patch(document, patch)
+    except PatchError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # Валидируем результат целиком.
+    try:
+        payload = LessonIn.model_validate(document)
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=json.loads(exc.json()))
+    validate_slug(payload.slug)
+
+    # Отправляем в базу только изменённые колонки.
+    changes = diff_lesson(lesson, payload.model_dump())
+    if not changes:
+        return FastJSONResponse(lesson, headers={'ETag': f'"{lesson["updated_at"]}"'})
+    updated = update_lesson_if_unmodified(lesson_id, changes, expected)
+    if not updated:
+        raise HTTPException(status_code=412, detail='Урок был изменён, обновите страницу.')
+    record_revision_safely(updated)
+    return FastJSONResponse(updated, headers={'ETag': f'"{updated["updated_at"]}"'})
+
+# История ревизий урока (от новых к старым).
+@api_router.get('/lessons/{lesson_id}/revisions')
+async def api_lesson_revisions(request: Request, lesson_id: str):
+    # Проверяем админ-доступ.
+    require_admin(request)
+
+    return FastJSONResponse({'items': list_revisions(lesson_id)})
+
+# Различия между двумя ревизиями урока (JSON Patch от from к to).
+@api_router.get('/lessons/{lesson_id}/revisions/diff')
+async def api_diff_revisions(
+    request: Request,
+    lesson_id: str,
+    from_number: int = Query(..., alias='from', ge=1),
+    to_number: int = Query(..., alias='to', ge=1),
+):
+    # Проверяем админ-доступ.
+    require_admin(request)
+
+    try:
+        patch = diff_revisions(lesson_id, from_number, to_number)
+    except RevisionNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    return FastJSONResponse({'from': from_number, 'to': to_number, 'patch': patch})
+
+# Восстановление урока из ревизии (записывается как новая ревизия).
+@api_router.post('/lessons/{lesson_id}/revisions/{number}/restore')
+async def api_restore_revision(request: Request, lesson_id: str, number: int):
+    # Проверяем админ-доступ.
+    require_admin(request)
+    # Проверяем CSRF.
+    ensure_csrf(request)
+
+    try:
+        document = load_revision(lesson_id, number)
+    except RevisionNotFound as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    updated = update_lesson(lesson_id, document)
+    record_revision_safely(updated)
+    return FastJSONResponse(updated, headers={'ETag': f'"{updated["updated_at"]}"'})
 
 # Удаление урока.
 @api_router.delete('/lessons/{lesson_id}')
@@ -204,7 +426,7 @@ async def api_delete_lesson(request: Request, lesson_id: str):
 
     # Удаляем урок и изображения.
     delete_lesson(lesson_id)
-    return JSONResponse({'status': 'ok'})
+    return FastJSONResponse({'status': 'ok'})
 
 # Загрузка изображений.
 @api_router.post('/upload-image')
@@ -216,30 +438,123 @@ async def api_upload_image(request: Request, file: UploadFile = File(...)):
 
     # Проверяем размер файла (<= 5 МБ).
     content = await file.read()
-    if len(content) > 5 * 1024 * 1024:
+    if len(content) > MAX_IMAGE_SIZE:
         raise HTTPException(status_code=400, detail='Файл больше 5 МБ.')
 
     # Загружаем файл в Storage.
     result = upload_image(content, file.filename, file.content_type or 'image/png')
-    return JSONResponse(result)
+    return FastJSONResponse(result)
+
+# Поиск уже загруженных изображений по хэшу: найденные файлы клиент не передаёт повторно.
+@api_router.post('/images/lookup')
+async def api_lookup_images(request: Request, payload: ImageLookupIn):
+    # Проверяем админ-доступ и CSRF.
+    require_admin(request)
+    ensure_csrf(request)
+
+    # Проверяем существование объектов параллельно.
+    async def lookup_one(image) -> Dict[str, Any] | None:
+        if image.content_type not in IMAGE_EXTENSIONS:
+            return None
+        return await run_in_threadpool(find_image, image.sha256, image.content_type)
+
+    found = await asyncio.gather(*(lookup_one(image) for image in payload.images))
+    return FastJSONResponse({'images': list(found)})
+
+# Пакетная загрузка изображений: параллельно, результаты отдаются NDJSON по мере готовности.
+@api_router.post('/upload-images')
+async def api_upload_images(request: Request, files: List[UploadFile] = File(...)):
+    # Проверяем админ-доступ и CSRF один раз на весь пакет.
+    require_admin(request)
+    ensure_csrf(request)
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f'Не больше {MAX_BATCH_FILES} файлов за раз.')
+
+    # Читаем файлы до начала ответа.
+    items = [(index, file.filename, file.content_type or 'image/png', await file.read()) for index, file in enumerate(files)]
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    # Загружаем один файл с ограничением параллельности.
+    async def upload_one(index: int, filename: str, content_type: str, content: bytes) -> Dict[str, Any]:
+        result = {'index': index, 'filename': filename}
+        if len(content) > MAX_IMAGE_SIZE:
+            return {**result, 'error': 'Файл больше 5 МБ.'}
+        async with semaphore:
+            try:
+                return {**result, **await run_in_threadpool(upload_image, content, filename, content_type)}
+            except Exception:
+                logger.exception('Не удалось загрузить изображение %s', filename)
+                return {**result, 'error': 'Ошибка загрузки изображения'}
+
+    # Отдаём результаты в порядке завершения.
+    async def results():
+        tasks = [asyncio.ensure_future(upload_one(*item)) for item in items]
+        for task in asyncio.as_completed(tasks):
+            yield dumps(await task) + b'\n'
+
+    return StreamingResponse(results(), media_type='application/x-ndjson')
+
 # Получение списка разделов.
 @api_router.get('/sections')
 async def api_list_sections(request: Request):
     # Проверяем админ-доступ.
     require_admin(request)
-    # Возвращаем список разделов.
-    return JSONResponse(get_sections())
+    # Возвращаем список разделов потоком.
+    return streamed_list(request, get_sections())
 
 # Получение списка уроков.
 @api_router.get('/lessons')
 async def api_list_lessons(request: Request, section_id: str | None = None):
     # Проверяем админ-доступ.
     require_admin(request)
-    # Фильтруем по разделу при необходимости.
-    lessons = get_lessons()
-    if section_id:
-        lessons = [l for l in lessons if l.get('section_id') == section_id]
-    return JSONResponse(lessons)
+    # Читаем уроки порциями (с фильтром по разделу на стороне базы) и отдаём потоком.
+    return streamed_list(request, iter_lessons(section_id))
+
+# Постраничный список уроков раздела для дашборда (только колонки списка).
+@api_router.get('/sections/{section_id}/lessons')
+async def api_section_lessons(
+    request: Request,
+    section_id: str,
+    page: int = 1,
+    per_page: int = 20,
+    status: str | None = None,
+    sort: str = 'number',
+):
+    # Проверяем админ-доступ.
+    require_admin(request)
+    # Проверяем параметры сортировки, фильтра и страницы.
+    order_by = sort.lstrip('-')
+    if order_by not in LESSON_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail='Недопустимое поле сортировки.')
+    if status and status not in LESSON_STATUSES:
+        raise HTTPException(status_code=400, detail='Недопустимый статус.')
+    page = max(page, 1)
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+
+    result = get_section_lessons_page(
+        section_id,
+        offset=(page - 1) * per_page,
+        limit=per_page,
+        status=status,
+        order_by=order_by,
+        desc=sort.startswith('-'),
+    )
+
+    # Добавляем статистику только по урокам текущей страницы.
+    lesson_ids = [lesson['id'] for lesson in result['items']]
+    if lesson_ids:
+        summary = {row['lesson_id']: row for row in get_attempt_summary(lesson_ids)}
+        counters = load_counters('lesson', lesson_ids)
+        for lesson in result['items']:
+            lesson['attempts'] = summary.get(lesson['id'])
+            lesson['counters'] = counters.get(lesson['id'])
+
+    return FastJSONResponse({
+        'items': result['items'],
+        'total': result['total'],
+        'page': page,
+        'per_page': per_page,
+    })
 
 # Получение урока по id.
 @api_router.get('/lessons/{lesson_id}')
@@ -249,4 +564,45 @@ async def api_get_lesson(request: Request, lesson_id: str):
     lesson = get_lesson_by_id(lesson_id)
     if not lesson:
         raise HTTPException(status_code=404, detail='Lesson not found')
-    return JSONResponse(lesson)
+    return FastJSONResponse(lesson, headers={'ETag': f'"{lesson["updated_at"]}"'})
+
+# Отправка ответов на тесты урока (проверка на сервере).
+@api_router.post('/lessons/{lesson_id}/attempts')
+async def api_submit_attempt(lesson_id: str, payload: AttemptIn):
+    # Получаем ключ ответов опубликованного урока (в пуле потоков: может обратиться к базе).
+    answer_key = await run_in_threadpool(get_answer_key, lesson_id)
+    if answer_key is None:
+        raise HTTPException(status_code=404, detail='Lesson not found')
+
+    # Оцениваем ответы; пустые попытки не записываем и не оцениваем.
+    graded = grade(answer_key, payload.answers)
+    if not graded['answered']:
+        raise HTTPException(status_code=400, detail='Не выбран ни один ответ.')
+    record_attempt(lesson_id, graded)
+    # Ключ ответов не раскрываем: только верно/неверно по отвеченным вопросам (null — без ответа).
+    return FastJSONResponse({
+        'score': graded['score'],
+        'total': graded['total'],
+        'results': [
+            result if answer is not None else None
+            for answer, result in zip(graded['answers'], graded['results'])
+        ],
+    })
+
+# Статистика попыток по вопросам урока.
+@api_router.get('/lessons/{lesson_id}/attempts/stats')
+async def api_attempt_stats(request: Request, lesson_id: str):
+    # Проверяем админ-доступ.
+    require_admin(request)
+    return FastJSONResponse(get_attempt_question_stats(lesson_id))
+
+# Beacon со временем на странице (отправляется браузером при уходе со страницы).
+@api_router.post('/beacon')
+async def api_beacon(payload: BeaconIn):
+    # Учитываем только известные разделы и уроки.
+    table = f'{payload.kind}s'
+    if payload.kind in COUNTER_KINDS and route_index.knows(table, payload.id):
+        if payload.view:
+            count_view(payload.kind, payload.id)
+        count_time(payload.kind, payload.id, payload.ms)
+    return Response(status_code=204)
@@ -0,0 +1,155 @@
+﻿# Назначение файла:
+# История изменений уроков: при каждом сохранении записывается сжатая дельта к предыдущей ревизии,
+# каждые K ревизий — полный снимок, чтобы восстановление оставалось дешёвым.
+
+# Импортируем системные инструменты.
+import base64
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+# Импортируем типы.
+from typing import Any, Dict, List, Tuple
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import get_last_revision, get_revision_chain, get_revisions, insert_revision
+# Импортируем построение и применение JSON Patch.
+from app.patching import apply_json_patch, make_json_patch
+
+logger = logging.getLogger(__name__)
+
+# Полный снимок записывается каждые K ревизий.
+REVISION_SNAPSHOT_EVERY = max(1, int(os.getenv('REVISION_SNAPSHOT_EVERY', '10')))
+# Поля урока, которые входят в ревизию (номер, раздел и статус меняются через каталог).
+REVISION_FIELDS = ('title', 'content')
+# Число уроков, для которых в памяти хранится последняя ревизия.
+REVISION_CACHE_SIZE = int(os.getenv('REVISION_CACHE_SIZE', '64'))
+# Попытки записи при гонке параллельных сохранений.
+REVISION_INSERT_ATTEMPTS = 3
+
+
+# Ревизия не найдена или её цепочка повреждена.
+class RevisionNotFound(LookupError):
+    pass
+
+
+# Последняя ревизия урока: lesson_id -> (номер, хэш, документ, длина цепочки от снимка).
+# Частые сохранения одного урока не перечитывают цепочку из базы.
+_latest: OrderedDict = OrderedDict()
+_latest_lock = threading.Lock()
+
+
+# Документ ревизии из строки урока.
+def revision_document(lesson: Dict[str, Any]) -> Dict[str, Any]:
+    return copy.deepcopy({field: lesson.get(field) for field in REVISION_FIELDS})
+
+# Каноническое представление JSON (одинаковые документы дают одинаковые байты).
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+# SHA-256 документа ревизии.
+def content_hash(document: Dict[str, Any]) -> str:
+    return hashlib.sha256(_canonical(document)).hexdigest()
+
+# Сжимаем значение для хранения.
+def _encode(value: Any) -> str:
+    return base64.b64encode(zlib.compress(_canonical(value), 9)).decode('ascii')
+
+# Разжимаем сохранённое значение.
+def _decode(data: str) -> Any:
+    return json.loads(zlib.decompress(base64.b64decode(data)))
+
+# Запоминаем последнюю ревизию урока.
+def _remember(lesson_id: str, entry: Tuple[int, str, Dict[str, Any], int]) -> None:
+    with _latest_lock:
+        _latest[lesson_id] = entry
+        _latest.move_to_end(lesson_id)
+        while len(_latest) > REVISION_CACHE_SIZE:
+            _latest.popitem(last=False)
+
+# Собираем документ из цепочки: снимок и дельты по порядку.
+def _replay(chain: List[Dict[str, Any]], number: int) -> Dict[str, Any]:
+    if not chain or chain[0]['kind'] != 'snapshot' or chain[-1]['number'] != number:
+        raise RevisionNotFound(f'Ревизия {number} не найдена.')
+    document = _decode(chain[0]['data'])
+    for row in chain[1:]:
+        document = apply_json_patch(document, _decode(row['data']))
+    return document
+
+# Восстанавливаем документ ревизии урока.
+def load_revision(lesson_id: str, number: int) -> Dict[str, Any]:
+    with _latest_lock:
+        cached = _latest.get(lesson_id)
+    if cached and cached[0] == number:
+        return copy.deepcopy(cached[2])
+    return _replay(get_revision_chain(lesson_id, number), number)
+
+# Последняя ревизия из кэша, если она совпадает с базой, иначе — из цепочки.
+def _load_latest(lesson_id: str, last: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    with _latest_lock:
+        cached = _latest.get(lesson_id)
+    if cached and cached[0] == last['number'] and cached[1] == last['content_hash']:
+        return cached[2], cached[3]
+    chain = get_revision_chain(lesson_id, last['number'])
+    return _replay(chain, last['number']), len(chain)
+
+# Записываем ревизию сохранённого урока. Возвращает номер новой ревизии или None,
+# если содержимое не изменилось с предыдущей.
+def record_revision(lesson: Dict[str, Any]) -> int | None:
+    lesson_id = lesson['id']
+    document = revision_document(lesson)
+    digest = content_hash(document)
+
+    for _ in range(REVISION_INSERT_ATTEMPTS):
+        last = get_last_revision(lesson_id)
+        if last and last['content_hash'] == digest:
+            return None
+
+        row = {
+            'lesson_id': lesson_id,
+            'number': last['number'] + 1 if last else 1,
+            'content_hash': digest,
+            'size': len(_canonical(document)),
+        }
+        chain_length = 1
+        if last:
+            try:
+                previous, chain_length = _load_latest(lesson_id, last)
+            except RevisionNotFound:
+                previous, chain_length = None, REVISION_SNAPSHOT_EVERY
+            if previous is not None and chain_length < REVISION_SNAPSHOT_EVERY:
+                row['kind'] = 'delta'
+                row['data'] = _encode(make_json_patch(previous, document))
+                chain_length += 1
+            else:
+                chain_length = 1
+        if 'kind' not in row:
+            row['kind'] = 'snapshot'
+            row['data'] = _encode(document)
+
+        if insert_revision(row):
+            _remember(lesson_id, (row['number'], digest, document, chain_length))
+            return row['number']
+    logger.warning('Не удалось записать ревизию урока %s: параллельные сохранения', lesson_id)
+    return None
+
+# Записываем ревизию, не прерывая сохранение урока при ошибке истории.
+def record_revision_safely(lesson: Dict[str, Any]) -> int | None:
+    try:
+        return record_revision(lesson)
+    except Exception:
+        logger.exception('Не удалось записать ревизию урока %s', lesson.get('id'))
+        return None
+
+# Список ревизий урока (от новых к старым).
+def list_revisions(lesson_id: str) -> List[Dict[str, Any]]:
+    return get_revisions(lesson_id)
+
+# Различия между двумя ревизиями в виде JSON Patch (от from_number к to_number).
+def diff_revisions(lesson_id: str, from_number: int, to_number: int) -> List[Dict[str, Any]]:
+    return make_json_patch(load_revision(lesson_id, from_number), load_revision(lesson_id, to_number))
@@ -0,0 +1,169 @@
+﻿# Назначение файла:
+# In-memory индекс маршрутов разделов и уроков (компактный каталог) с негативным кэшем промахов.
+
+# Импортируем системные инструменты.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Импортируем типы.
+from typing import Any, Dict, Tuple
+
+# Импортируем функции работы с Supabase.
+from app.supabase_client import get_sections, get_lesson_listing, on_content_write
+# Импортируем снимок каталога на диске.
+from app.resilience import UpstreamUnavailable, snapshot_store
+# Импортируем компактный каталог навигации.
+from app.catalog import Catalog, LessonEntry, SectionEntry
+
+# Максимальный возраст индекса (сек.), после которого он перечитывается.
+ROUTE_INDEX_TTL = float(os.getenv('ROUTE_INDEX_TTL', '60'))
+# Минимальный интервал (сек.) между перечитываниями индекса из-за промахов.
+ROUTE_INDEX_MIN_REFRESH = float(os.getenv('ROUTE_INDEX_MIN_REFRESH', '5'))
+# Размер и время жизни негативного кэша.
+NEGATIVE_CACHE_SIZE = int(os.getenv('NEGATIVE_CACHE_SIZE', '10000'))
+NEGATIVE_CACHE_TTL = float(os.getenv('NEGATIVE_CACHE_TTL', '300'))
+
+
+# Индекс маршрутов поверх компактного каталога: (номер, slug) -> раздел, (раздел, номер, slug) -> урок.
+class RouteIndex:
+    def __init__(self) -> None:
+        # Блокировка для перестроения индекса.
+        self._lock = threading.Lock()
+        # Текущий каталог (None — ещё не загружен); заменяется целиком при обновлении.
+        self._catalog: Catalog | None = None
+        # Момент последней загрузки (monotonic) и флаг устаревания.
+        self._loaded_at = 0.0
+        self._stale = True
+        # Негативный кэш: ключ -> момент истечения.
+        self._misses: OrderedDict = OrderedDict()
+
+    # Перечитываем индекс из базы.
+    def refresh(self) -> None:
+        # Загружаем только колонки списка.
+        sections = get_sections()
+        lessons = get_lesson_listing()
+        catalog = Catalog(sections, lessons)
+        with self._lock:
+            self._catalog = catalog
+            self._loaded_at = time.monotonic()
+            self._stale = False
+        # Сохраняем последний удачный каталог на диск.
+        snapshot_store.save_catalog(sections, lessons)
+
+    # Без доступа к базе: если индекс ещё пуст, берём снимок каталога с диска.
+    def _ensure_offline(self) -> None:
+        if self._catalog is not None:
+            return
+        snapshot = snapshot_store.load_catalog()
+        if not snapshot:
+            raise UpstreamUnavailable('no catalog snapshot')
+        catalog = Catalog(*snapshot)
+        with self._lock:
+            if self._catalog is None:
+                self._catalog = catalog
+
+    # Помечаем индекс устаревшим и сбрасываем негативный кэш (подписчик на запись).
+    def invalidate(self, table: str | None = None, row_id: str | None = None) -> None:
+        with self._lock:
+            self._stale = True
+            self._misses.clear()
+
+    # Перечитываем индекс, если он устарел.
+    def _ensure_fresh(self) -> None:
+        if self._stale or time.monotonic() - self._loaded_at > ROUTE_INDEX_TTL:
+            self.refresh()
+
+    # Готовим каталог к чтению: из базы или, без доступа к ней, из уже загруженных данных.
+    def _current(self, offline: bool) -> Catalog:
+        if offline:
+            self._ensure_offline()
+        else:
+            self._ensure_fresh()
+        return self._catalog
+
+    # Проверяем ключ в негативном кэше.
+    def _is_known_miss(self, key: Tuple) -> bool:
+        with self._lock:
+            expires_at = self._misses.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._misses[key]
+                return False
+            return True
+
+    # Запоминаем промах, вытесняя самые старые записи.
+    def _remember_miss(self, key: Tuple) -> None:
+        with self._lock:
+            self._misses[key] = time.monotonic() + NEGATIVE_CACHE_TTL
+            self._misses.move_to_end(key)
+            while len(self._misses) > NEGATIVE_CACHE_SIZE:
+                self._misses.popitem(last=False)
+
+    # Общая логика поиска с негативным кэшем (offline — только по уже загруженным данным).
+    def _lookup(self, mapping_name: str, key: Any, offline: bool = False):
+        found = getattr(self._current(offline), mapping_name).get(key)
+        if found is not None or offline:
+            return found
+        miss_key = (mapping_name, key)
+        if self._is_known_miss(miss_key):
+            return None
+        # Индекс мог отстать от записей другого воркера — перечитываем, но не чаще интервала.
+        if time.monotonic() - self._loaded_at > ROUTE_INDEX_MIN_REFRESH:
+            self.refresh()
+            found = getattr(self._catalog, mapping_name).get(key)
+            if found is not None:
+                return found
+        self._remember_miss(miss_key)
+        return None
+
+    # Ищем раздел по номеру и slug.
+    def resolve_section(self, number: int, slug: str, offline: bool = False) -> SectionEntry | None:
+        return self._lookup('sections_by_key', (number, slug), offline)
+
+    # Ищем опубликованный урок раздела по номеру и slug (без контента).
+    def resolve_lesson(self, section_id: str, number: int, slug: str, offline: bool = False) -> LessonEntry | None:
+        return self._lookup('lessons_by_key', (section_id, number, slug), offline)
+
+    # Ищем опубликованный урок по id (без контента).
+    def published_lesson(self, lesson_id: str, offline: bool = False) -> LessonEntry | None:
+        return self._lookup('lessons_by_id', lesson_id, offline)
+
+    # Все разделы по порядку номеров.
+    def sections(self, offline: bool = False) -> Tuple[SectionEntry, ...]:
+        return self._current(offline).sections
+
+    # Опубликованные уроки раздела по порядку номеров (без контента).
+    def section_lessons(self, section_id: str, offline: bool = False) -> Tuple[LessonEntry, ...]:
+        return self._current(offline).section_lessons(section_id)
+
+    # Предыдущий и следующий опубликованный урок раздела.
+    def neighbours(self, lesson: LessonEntry, offline: bool = False) -> Tuple[LessonEntry | None, LessonEntry | None]:
+        return self._current(offline).neighbours(lesson)
+
+    # Проверяем, что запись с таким id есть в уже загруженном индексе (без обновления и обращений к базе:
+    # вызывается на каждый beacon, поэтому неизвестный id не должен приводить к перечитыванию каталога).
+    def knows(self, table: str, row_id: str) -> bool:
+        catalog = self._catalog
+        return catalog is not None and catalog.knows(table, row_id)
+
+    # Размеры индекса, память каталога и негативного кэша (для диагностики).
+    def stats(self) -> Dict[str, float]:
+        catalog = self._catalog
+        if catalog is None:
+            return {'sections': 0, 'lessons': 0, 'negative_cache': len(self._misses)}
+        return {
+            'sections': len(catalog.sections),
+            'lessons': len(catalog.lessons),
+            'negative_cache': len(self._misses),
+            **catalog.memory_usage(),
+        }
+
+
+# Глобальный индекс маршрутов воркера.
+route_index = RouteIndex()
+
+# Сбрасываем индекс при любой записи разделов и уроков.
+on_content_write(route_index.invalidate)
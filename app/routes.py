@@ -4,19 +4,20 @@
 # Импортируем FastAPI компоненты.
 import json
 import re
+from functools import partial
+
+# Импортируем типы.
+from typing import Any, Callable, Dict
 
 from fastapi import APIRouter, Request, Form, HTTPException
 # Импортируем ответы и перенаправления.
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, Response
 # Импортируем шаблоны Jinja2.
 from fastapi.templating import Jinja2Templates
 
 # Импортируем функции работы с Supabase.
 from app.supabase_client import (
     get_sections,
-    get_lessons,
-    get_section_by_number_slug,
-    get_lesson_by_section,
     get_section_by_id,
     get_lesson_by_id,
     create_section,
@@ -26,11 +27,27 @@ from app.supabase_client import (
     update_lesson,
     delete_lesson,
     extract_image_paths,
+    get_attempt_question_stats,
+    get_section_lesson_counts,
 )
 # Импортируем функции аутентификации.
 from app.admin_auth import verify_credentials, set_admin_session, clear_admin_session, ensure_csrf_token
 # Импортируем очистку HTML и проверку slug.
-from app.rest import sanitize_html, validate_slug
+from app.rest import sanitize_html, render_lesson_html, validate_slug, diff_lesson
+# Импортируем индекс маршрутов.
+from app.route_index import route_index
+# Импортируем историю изменений уроков.
+from app.revisions import record_revision_safely
+# Импортируем счётчики просмотров.
+from app.counters import count_view
+# Импортируем кэш частей урока.
+from app.fragments import FRAGMENT_PARTS, get_fragment, get_lesson_theory
+# Импортируем прогрев следующего урока и распознавание предзагрузки.
+from app.prefetch import is_speculative, schedule_warm
+# Импортируем перезапись адресов изображений на локальный кэш.
+from app.images import local_image_urls
+# Импортируем дедлайны и предохранитель.
+from app.resilience import BREAKER_RESET_TIMEOUT, UpstreamUnavailable, call_upstream
 
 # Создаём роутер страниц.
 pages_router = APIRouter()
@@ -46,12 +63,13 @@ def parse_descriptor(descriptor: str):
     return int(match.group('number')), match.group('slug')
 
 # Нормализуем тесты из формы, очищаем HTML и приводим к 4 вариантам.
-def normalize_tests(raw_tests):
+def normalize_tests(raw_tests, sanitize: bool = True):
+    clean = sanitize_html if sanitize else (lambda html: html)
     cleaned = []
     for test in (raw_tests or []):
-        question_html = sanitize_html(test.get('question', '') or '')
+        question_html = clean(test.get('question', '') or '')
         raw_options = test.get('options') or []
-        options = [sanitize_html(opt or '') for opt in raw_options]
+        options = [clean(opt or '') for opt in raw_options]
         if len(options) < 4:
             options += [''] * (4 - len(options))
         options = options[:4]
@@ -69,89 +87,158 @@ def normalize_tests(raw_tests):
 
 # Инициализируем шаблоны.
 templates = Jinja2Templates(directory='templates')
+templates.env.filters['local_images'] = local_image_urls
+
+# Отрендеренная страница 404 (не зависит от запроса, рендерим один раз).
+_not_found_body: bytes | None = None
+
+# Ответ 404 без обращений к базе.
+def not_found_response(request: Request) -> HTMLResponse:
+    global _not_found_body
+    if _not_found_body is None:
+        _not_found_body = templates.get_template('404.html').render({'request': request}).encode('utf-8')
+    return HTMLResponse(_not_found_body, status_code=404)
+
+# Ответ, когда Supabase недоступен и в снимке нет нужных данных.
+def unavailable_response() -> HTMLResponse:
+    return HTMLResponse(
+        '<h1>Сервис временно недоступен</h1><p>Попробуйте обновить страницу через несколько секунд.</p>',
+        status_code=503,
+        headers={'Retry-After': str(int(BREAKER_RESET_TIMEOUT))},
+    )
+
+# Загружаем данные страницы с дедлайном маршрута; если Supabase недоступен — из снимка каталога.
+# loader(*args, offline) выполняется в пуле потоков и возвращает данные или None (страница не найдена,
+# в том числе при ошибке запроса 4xx от PostgREST).
+async def load_page_data(route: str, loader: Callable, *args: Any) -> Any:
+    try:
+        return await call_upstream(route, loader, *args, False)
+    except UpstreamUnavailable:
+        return loader(*args, True)
+
+# Данные главной страницы: разделы и опубликованные уроки по разделам (срезы каталога).
+def _index_context(offline: bool) -> Dict[str, Any]:
+    sections = route_index.sections(offline)
+    return {
+        'sections': sections,
+        'lessons_by_section': {s.id: route_index.section_lessons(s.id, offline) for s in sections},
+    }
+
+# Данные страницы раздела.
+def _section_context(number: int, slug: str, offline: bool) -> Dict[str, Any] | None:
+    section = route_index.resolve_section(number, slug, offline)
+    if not section:
+        return None
+    return {'section': section, 'lessons': route_index.section_lessons(section.id, offline)}
+
+# Данные страницы урока: раздел, теория урока и соседние уроки для навигации.
+def _lesson_context(
+    section_number: int,
+    section_slug: str,
+    lesson_number: int,
+    lesson_slug: str,
+    offline: bool,
+) -> Dict[str, Any] | None:
+    section = route_index.resolve_section(section_number, section_slug, offline)
+    if not section:
+        return None
+    listed = route_index.resolve_lesson(section.id, lesson_number, lesson_slug, offline)
+    if not listed:
+        return None
+
+    # Загружаем только теорию (тесты и задачи подгружаются фрагментами).
+    lesson = get_lesson_theory(listed.id, offline)
+    if not lesson:
+        return None
+
+    # Соседние уроки берём из каталога по позиции урока.
+    prev_lesson, next_lesson = route_index.neighbours(listed, offline)
+    return {'section': section, 'lesson': lesson, 'prev_lesson': prev_lesson, 'next_lesson': next_lesson}
 
 # Главная страница: список разделов и уроков.
 @pages_router.get('/')
 async def index(request: Request):
-    # Загружаем данные разделов и уроков.
-    sections = get_sections()
-    lessons = [l for l in get_lessons() if l.get('status') == 'published']
-
-    # Собираем уроки по разделам.
-    lessons_by_section = {}
-    for lesson in lessons:
-        lessons_by_section.setdefault(lesson['section_id'], []).append(lesson)
-
-    # Сортируем уроки внутри разделов по номеру.
-    for section_id in lessons_by_section:
-        lessons_by_section[section_id] = sorted(lessons_by_section[section_id], key=lambda x: x['number'])
+    # Загружаем разделы и уроки из индекса маршрутов.
+    try:
+        context = await load_page_data('index', _index_context)
+    except UpstreamUnavailable:
+        return unavailable_response()
+    if context is None:
+        return unavailable_response()
 
     # Рендерим шаблон.
-    return templates.TemplateResponse('index.html', {
-        'request': request,
-        'sections': sections,
-        'lessons_by_section': lessons_by_section,
-    })
+    return templates.TemplateResponse('index.html', {'request': request, **context})
 
 # Страница раздела.
 @pages_router.get('/section-{section_descriptor}')
 async def section_page(request: Request, section_descriptor: str):
     parsed = parse_descriptor(section_descriptor)
     if not parsed:
-        return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
+        return not_found_response(request)
 
-    section_number, section_slug = parsed
-    # Ищем раздел.
-    section = get_section_by_number_slug(section_number, section_slug)
-    if not section:
-        return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
+    # Ищем раздел и его уроки по индексу маршрутов.
+    try:
+        context = await load_page_data('section', _section_context, *parsed)
+    except UpstreamUnavailable:
+        return unavailable_response()
+    if not context:
+        return not_found_response(request)
 
-    # Загружаем уроки раздела.
-    lessons = [l for l in get_lessons() if l.get('section_id') == section['id'] and l.get('status') == 'published']
-    lessons = sorted(lessons, key=lambda x: x['number'])
+    # Учитываем просмотр.
+    count_view('section', context['section'].id)
 
     # Рендерим страницу раздела.
-    return templates.TemplateResponse('section.html', {
-        'request': request,
-        'section': section,
-        'lessons': lessons,
-    })
+    return templates.TemplateResponse('section.html', {'request': request, **context})
 
 @pages_router.get('/section-{section_descriptor}/lesson-{lesson_descriptor}')
 async def lesson_page(request: Request, section_descriptor: str, lesson_descriptor: str):
-    # Ищем раздел.
+    # Разбираем адрес раздела и урока.
     section_parsed = parse_descriptor(section_descriptor)
     lesson_parsed = parse_descriptor(lesson_descriptor)
     if not section_parsed or not lesson_parsed:
-        return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
-    section_number, section_slug = section_parsed
-    lesson_number, lesson_slug = lesson_parsed
-    section = get_section_by_number_slug(section_number, section_slug)
-    if not section:
-        return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
+        return not_found_response(request)
 
-    # Ищем урок.
-    lesson = get_lesson_by_section(section_number, section['id'], lesson_slug, lesson_number)
-    if not lesson or lesson.get('status') != 'published':
-        return templates.TemplateResponse('404.html', {'request': request}, status_code=404)
+    try:
+        context = await load_page_data('lesson', _lesson_context, *section_parsed, *lesson_parsed)
+    except UpstreamUnavailable:
+        return unavailable_response()
+    if not context:
+        return not_found_response(request)
+
+    # Предзагрузку браузером не считаем просмотром: его учтёт beacon при показе страницы.
+    speculative = is_speculative(request)
+    if not speculative:
+        count_view('lesson', context['lesson']['id'])
+        # Читатели идут по урокам подряд: заранее прогреваем кэши следующего урока.
+        if context['next_lesson']:
+            schedule_warm(context['next_lesson'].id, render_fragment)
 
-    # Загружаем список уроков для навигации.
-    lessons = [l for l in get_lessons() if l.get('section_id') == section['id'] and l.get('status') == 'published']
-    lessons = sorted(lessons, key=lambda x: x['number'])
+    # Рендерим страницу урока.
+    return templates.TemplateResponse('lesson.html', {'request': request, 'speculative': speculative, **context})
 
-    # Определяем предыдущий и следующий урок.
-    current_index = next((i for i, l in enumerate(lessons) if l['id'] == lesson['id']), None)
-    prev_lesson = lessons[current_index - 1] if current_index is not None and current_index > 0 else None
-    next_lesson = lessons[current_index + 1] if current_index is not None and current_index < len(lessons) - 1 else None
+# Рендерим фрагмент урока (тесты или задачи).
+def render_fragment(part: str, lesson: dict) -> str:
+    return templates.get_template(f'_lesson_{part}.html').render({'lesson': lesson})
 
-    # Рендерим страницу урока.
-    return templates.TemplateResponse('lesson.html', {
-        'request': request,
-        'section': section,
-        'lesson': lesson,
-        'prev_lesson': prev_lesson,
-        'next_lesson': next_lesson,
-    })
+# HTML-фрагмент урока (тесты или задачи), подгружается при прокрутке.
+@pages_router.get('/lesson-fragments/{lesson_id}/{part}')
+async def lesson_fragment(request: Request, lesson_id: str, part: str):
+    if part not in FRAGMENT_PARTS:
+        return not_found_response(request)
+
+    try:
+        fragment = await load_page_data('fragment', get_fragment, lesson_id, part, partial(render_fragment, part))
+    except UpstreamUnavailable:
+        return unavailable_response()
+    if not fragment:
+        return not_found_response(request)
+
+    updated_at, body = fragment
+    etag = f'"{lesson_id}:{part}:{updated_at}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=60'}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body, headers=headers)
 
 # Страница входа или админка.
 @pages_router.get('/bod')
@@ -177,20 +264,15 @@ async def admin_dashboard(request: Request):
 
     csrf_token = ensure_csrf_token(request)
 
+    # Загружаем только разделы и количество уроков; уроки подгружаются постранично.
     sections = get_sections()
-    lessons = get_lessons()
-
-    lessons_by_section: dict[str, list] = {}
-    for lesson in lessons:
-        lessons_by_section.setdefault(lesson['section_id'], []).append(lesson)
-    for section_id in lessons_by_section:
-        lessons_by_section[section_id] = sorted(lessons_by_section[section_id], key=lambda x: x['number'])
+    lesson_counts = {row['section_id']: row for row in get_section_lesson_counts()}
 
     return templates.TemplateResponse('admin.html', {
         'request': request,
         'csrf_token': csrf_token,
         'sections': sections,
-        'lessons_by_section': lessons_by_section,
+        'lesson_counts': lesson_counts,
     })
 
 # Создание раздела.
@@ -347,12 +429,12 @@ async def admin_lesson_create(request: Request):
             raise ValueError('Название урока обязательно.')
         validate_slug(slug)
 
-        theory_html = sanitize_html(form.get('theory_html', ''))
+        theory_html = render_lesson_html(form.get('theory_html', ''))
         tasks = json.loads(form.get('tasks_json') or '[]')
         tests = normalize_tests(json.loads(form.get('tests_json') or '[]'))
 
         for task in tasks:
-            task['html'] = sanitize_html(task.get('html', ''))
+            task['html'] = render_lesson_html(task.get('html', ''))
 
         task_html = ' '.join([task.get('html', '') for task in tasks])
         tests_html = ' '.join([test.get('question', '') for test in tests])
@@ -377,6 +459,7 @@ async def admin_lesson_create(request: Request):
             'status': status,
             'content': content,
         })
+        record_revision_safely(created)
         if action == 'draft':
             return RedirectResponse(f"/bod/lesson/edit/{created['id']}", status_code=302)
         return RedirectResponse('/bod/dashboard', status_code=302)
@@ -423,6 +506,7 @@ async def admin_lesson_edit_page(request: Request, lesson_id: str):
         'sections': sections,
         'default_section_id': lesson.get('section_id'),
         'initial_data': initial_data,
+        'attempt_stats': get_attempt_question_stats(lesson_id),
         'error': None,
     })
 
@@ -453,36 +537,23 @@ async def admin_lesson_edit(request: Request, lesson_id: str):
             raise ValueError('Название урока обязательно.')
         validate_slug(slug)
 
-        theory_html = sanitize_html(form.get('theory_html', ''))
+        # Очищаем и переиндексируем только изменённые фрагменты, сохраняем только изменённые колонки.
         tasks = json.loads(form.get('tasks_json') or '[]')
-        tests = normalize_tests(json.loads(form.get('tests_json') or '[]'))
-
-        for task in tasks:
-            task['html'] = sanitize_html(task.get('html', ''))
-
-        task_html = ' '.join([task.get('html', '') for task in tasks])
-        tests_html = ' '.join([test.get('question', '') for test in tests])
-        image_paths = list(set(
-            extract_image_paths(theory_html)
-            + extract_image_paths(task_html)
-            + extract_image_paths(tests_html)
-        ))
-
-        content = {
-            'theory': {'title': title, 'html': theory_html, 'images': extract_image_paths(theory_html)},
-            'tests': tests,
-            'tasks': tasks,
-            'images': image_paths,
-        }
-
-        update_lesson(lesson_id, {
+        tests = normalize_tests(json.loads(form.get('tests_json') or '[]'), sanitize=False)
+        changes = diff_lesson(lesson, {
             'section_id': section_id,
             'number': number,
             'title': title,
             'slug': slug,
             'status': status,
-            'content': content,
+            'content': {
+                'theory': {'title': title, 'html': form.get('theory_html', '')},
+                'tests': tests,
+                'tasks': [{'title': task.get('title', ''), 'html': task.get('html', '')} for task in tasks],
+            },
         })
+        if changes:
+            record_revision_safely(update_lesson(lesson_id, changes))
         if action == 'draft':
             return RedirectResponse(f'/bod/lesson/edit/{lesson_id}', status_code=302)
         return RedirectResponse('/bod/dashboard', status_code=302)
@@ -0,0 +1,102 @@
+﻿# Назначение файла:
+# Быстрый холодный старт: отложенный прогрев тяжёлых зависимостей и отчёт о времени импорта.
+# Отчёт: python -m app.startup [--budget-ms 700] — завершается с кодом 1, если импорт app.main дольше бюджета.
+
+# Импортируем системные инструменты.
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Импортируем типы.
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Режим старта: lazy — прогрев в фоне после открытия порта, eager — до приёма запросов.
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'lazy')
+# Задержка фонового прогрева (сек.), чтобы сервер успел открыть порт и принять первый запрос.
+WARMUP_DELAY = float(os.getenv('WARMUP_DELAY', '0.5'))
+# Бюджет времени импорта app.main (мс).
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', '700'))
+
+# Шаблоны, которые компилируются при прогреве.
+WARMUP_TEMPLATES = ('base.html', 'index.html', 'section.html', 'lesson.html', '404.html')
+
+
+# Прогреваем то, что не нужно для открытия порта: клиент Supabase, шаблоны, индекс маршрутов.
+def warm_up() -> None:
+    from app.supabase_client import supabase
+    from app.routes import templates
+    from app.route_index import route_index
+
+    steps = (
+        ('supabase', supabase.get),
+        ('templates', lambda: [templates.get_template(name) for name in WARMUP_TEMPLATES]),
+        ('route_index', route_index.refresh),
+    )
+    for name, step in steps:
+        try:
+            step()
+        except Exception:
+            # Прогрев необязателен: при ошибке всё загрузится при первом запросе.
+            logger.exception('Не удалось прогреть %s', name)
+
+
+# Разбираем вывод -X importtime: (модуль, собственное время, накопленное время) в мкс.
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+# Импортируем модуль в отдельном процессе с -X importtime.
+def measure_import(module: str = 'app.main') -> List[Tuple[str, int, int]]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+# Суммируем собственное время модулей по пакетам верхнего уровня.
+def group_by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.split('.')[0]] += self_us
+    return packages
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Отчёт о времени импорта приложения.')
+    parser.add_argument('--module', default='app.main')
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    rows = measure_import(args.module)
+    total_ms = next((cumulative for name, _, cumulative in rows if name == args.module), 0) / 1000
+
+    print(f'Импорт {args.module}: {total_ms:.1f} мс (бюджет {args.budget_ms:.0f} мс)\n')
+    print('Пакеты по собственному времени импорта:')
+    for package, self_us in sorted(group_by_package(rows).items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {self_us / 1000:8.1f} мс  {package}')
+    print('\nМодули по накопленному времени импорта:')
+    for name, _, cumulative in sorted(rows, key=lambda row: -row[2])[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} мс  {name}')
+
+    if total_ms > args.budget_ms:
+        print(f'\nБюджет превышен на {total_ms - args.budget_ms:.1f} мс.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
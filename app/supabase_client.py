@@ -2,33 +2,91 @@
 # Подключение к Supabase и функции доступа к данным и Storage.
 
 # Импортируем системные инструменты.
+import hashlib
 import os
 import re
-import uuid
+import threading
+import time
 
-# Импортируем клиент Supabase.
-from supabase import create_client
+# Импортируем тип для файлов.
+from typing import List, Dict, Any, Callable, Iterator
 
-# Импортируем загрузчик переменных окружения.
-from dotenv import load_dotenv
+# Бакет Storage для изображений уроков.
+STORAGE_BUCKET = os.getenv('STORAGE_BUCKET', 'lesson-images')
+# Таймаут HTTP-запросов к Supabase (сек.); по умолчанию у клиента он 120 секунд.
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '10'))
 
-# Импортируем тип для файлов.
-from typing import List, Dict, Any
 
-# Загружаем переменные окружения из .env (если файл существует).
-load_dotenv()
+# Клиент Supabase, создаваемый при первом обращении.
+# Пакет supabase тяжёлый (httpx, postgrest, storage3, auth), поэтому не импортируем его при старте.
+class LazySupabaseClient:
+    def __init__(self) -> None:
+        self._client = None
+        self._lock = threading.Lock()
 
-# Переменные окружения для Supabase.
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-STORAGE_BUCKET = os.getenv('STORAGE_BUCKET', 'lesson-images')
+    # Создаём клиента (один раз на процесс).
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import ClientOptions, create_client
+                    self._client = create_client(
+                        os.getenv('SUPABASE_URL'),
+                        os.getenv('SUPABASE_KEY'),
+                        options=ClientOptions(
+                            postgrest_client_timeout=SUPABASE_TIMEOUT,
+                            storage_client_timeout=int(SUPABASE_TIMEOUT),
+                        ),
+                    )
+        return self._client
 
-# Инициализируем клиента Supabase.
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    # Передаём обращения (table, rpc, storage) настоящему клиенту.
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+
+# Клиент Supabase.
+supabase = LazySupabaseClient()
 
 # Регулярное выражение для извлечения data-path изображений.
 IMAGE_PATH_RE = re.compile(r'data-path="([^"]+)"')
 
+# Расширения файлов изображений по MIME-типу.
+IMAGE_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+    'image/svg+xml': '.svg',
+}
+
+# Сколько секунд считать подтверждённый объект существующим (его может удалить другой воркер).
+KNOWN_OBJECTS_TTL = float(os.getenv('KNOWN_OBJECTS_TTL', '60'))
+# Максимальное число подтверждённых объектов в памяти.
+KNOWN_OBJECTS_MAX = int(os.getenv('KNOWN_OBJECTS_MAX', '10000'))
+
+# Объекты Storage, существование которых уже подтверждено: путь -> момент истечения.
+_known_objects: Dict[str, float] = {}
+_known_objects_lock = threading.Lock()
+
+# Колонки для списков и навигации (без тяжёлых content/meta).
+LESSON_LISTING_COLUMNS = 'id,section_id,number,title,slug,status,updated_at'
+
+# Подписчики на изменения контента (для инвалидации кэшей).
+_write_listeners: List[Callable[[str, str | None], None]] = []
+
+# Регистрируем подписчика на изменения контента.
+def on_content_write(listener: Callable[[str, str | None], None]) -> Callable[[str, str | None], None]:
+    # Сохраняем подписчика; возвращаем его, чтобы использовать как декоратор.
+    _write_listeners.append(listener)
+    return listener
+
+# Уведомляем подписчиков об изменении таблицы.
+def notify_content_write(table: str, row_id: str | None = None) -> None:
+    # Вызываем всех подписчиков по очереди.
+    for listener in list(_write_listeners):
+        listener(table, row_id)
+
 # Получаем все разделы.
 def get_sections() -> List[Dict[str, Any]]:
     # Запрашиваем разделы, отсортированные по номеру.
@@ -41,6 +99,92 @@ def get_lessons() -> List[Dict[str, Any]]:
     response = supabase.table('lessons').select('*').order('number').execute()
     return response.data or []
 
+# Перебираем уроки порциями по id (keyset-пагинация), не загружая весь список в память.
+def iter_lessons(section_id: str | None = None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    last_id = None
+    while True:
+        query = supabase.table('lessons').select('*')
+        if section_id:
+            query = query.eq('section_id', section_id)
+        if last_id:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(batch_size).execute().data or []
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+# Получаем уроки без контента (для навигации и индексов).
+def get_lesson_listing() -> List[Dict[str, Any]]:
+    # Запрашиваем только колонки списка.
+    response = supabase.table('lessons').select(LESSON_LISTING_COLUMNS).order('number').execute()
+    return response.data or []
+
+# Получаем страницу уроков раздела без контента.
+def get_section_lessons_page(
+    section_id: str,
+    offset: int,
+    limit: int,
+    status: str | None = None,
+    order_by: str = 'number',
+    desc: bool = False,
+) -> Dict[str, Any]:
+    # Фильтруем, сортируем и ограничиваем выборку на стороне базы.
+    query = (
+        supabase.table('lessons')
+        .select(LESSON_LISTING_COLUMNS, count='exact')
+        .eq('section_id', section_id)
+    )
+    if status:
+        query = query.eq('status', status)
+    response = query.order(order_by, desc=desc).range(offset, offset + limit - 1).execute()
+    return {'items': response.data or [], 'total': response.count or 0}
+
+# Получаем страницу опубликованных уроков без контента (для sitemap).
+def get_published_lessons_page(offset: int, limit: int) -> Dict[str, Any]:
+    # Стабильный порядок по id позволяет читать список частями.
+    response = (
+        supabase.table('lessons')
+        .select(LESSON_LISTING_COLUMNS, count='exact')
+        .eq('status', 'published')
+        .order('id')
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return {'items': response.data or [], 'total': response.count or 0}
+
+# Получаем недавно обновлённые опубликованные уроки (для ленты).
+def get_recent_lessons(limit: int) -> List[Dict[str, Any]]:
+    # Сортируем по дате обновления.
+    response = (
+        supabase.table('lessons')
+        .select(LESSON_LISTING_COLUMNS)
+        .eq('status', 'published')
+        .order('updated_at', desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
+
+# Получаем количество уроков по разделам.
+def get_section_lesson_counts() -> List[Dict[str, Any]]:
+    # Читаем агрегированное представление.
+    response = supabase.table('section_lesson_counts').select('*').execute()
+    return response.data or []
+
+# Получаем урок с одной частью контента (theory, tests или tasks).
+def get_lesson_part(lesson_id: str, part: str) -> Dict[str, Any] | None:
+    # Выбираем колонки списка и только нужную часть content.
+    response = (
+        supabase.table('lessons')
+        .select(f'{LESSON_LISTING_COLUMNS},{part}:content->{part}')
+        .eq('id', lesson_id)
+        .limit(1)
+        .execute()
+    )
+    data = response.data or []
+    return data[0] if data else None
+
 # Получаем урок по id.
 def get_lesson_by_id(lesson_id: str) -> Dict[str, Any] | None:
     # Фильтруем по id.
@@ -88,59 +232,266 @@ def get_lesson_by_section(number: int, section_id: str, lesson_slug: str, lesson
 def create_section(payload: Dict[str, Any]) -> Dict[str, Any]:
     # Добавляем запись.
     response = supabase.table('sections').insert(payload).execute()
+    notify_content_write('sections', response.data[0].get('id'))
     return response.data[0]
 
 # Обновляем раздел.
 def update_section(section_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     # Обновляем запись по id.
     response = supabase.table('sections').update(payload).eq('id', section_id).execute()
+    notify_content_write('sections', section_id)
     return response.data[0]
 
 # Удаляем раздел.
 def delete_section(section_id: str) -> None:
     # Удаляем раздел (уроки удалятся каскадно).
     supabase.table('sections').delete().eq('id', section_id).execute()
+    notify_content_write('sections', section_id)
 
 # Создаём урок.
 def create_lesson(payload: Dict[str, Any]) -> Dict[str, Any]:
     # Добавляем запись.
     response = supabase.table('lessons').insert(payload).execute()
+    notify_content_write('lessons', response.data[0].get('id'))
     return response.data[0]
 
 # Обновляем урок.
 def update_lesson(lesson_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     # Обновляем запись.
     response = supabase.table('lessons').update(payload).eq('id', lesson_id).execute()
+    notify_content_write('lessons', lesson_id)
     return response.data[0]
 
-# Удаляем урок и связанные изображения.
+# Обновляем урок, только если он не менялся с указанной версии.
+def update_lesson_if_unmodified(lesson_id: str, payload: Dict[str, Any], updated_at: str) -> Dict[str, Any] | None:
+    # Условие по updated_at делает проверку и запись атомарными.
+    response = (
+        supabase.table('lessons')
+        .update(payload)
+        .eq('id', lesson_id)
+        .eq('updated_at', updated_at)
+        .execute()
+    )
+    data = response.data or []
+    if not data:
+        return None
+    notify_content_write('lessons', lesson_id)
+    return data[0]
+
+# Меняем порядок разделов и/или уроков одной транзакцией на стороне базы.
+def reorder_catalog(section_ids: List[str] | None, lessons: Dict[str, List[str]]) -> None:
+    # Импортируем ошибку PostgREST (пакет уже загружен вместе с клиентом).
+    from postgrest.exceptions import APIError
+
+    # Функция базы проверяет полноту порядка и откладывает проверку уникальности номеров.
+    try:
+        supabase.rpc('reorder_catalog', {'p_section_ids': section_ids, 'p_lessons': lessons}).execute()
+    except APIError as exc:
+        raise ValueError(exc.message or 'Не удалось изменить порядок.') from exc
+    if section_ids is not None:
+        notify_content_write('sections', None)
+    if lessons:
+        notify_content_write('lessons', None)
+
+# Удаляем урок и изображения, которые не используются другими уроками.
 def delete_lesson(lesson_id: str) -> None:
     # Сначала получаем урок, чтобы извлечь пути изображений.
-    response = supabase.table('lessons').select('content').eq('id', lesson_id).limit(1).execute()
+    response = supabase.table('lessons').select('images:content->images').eq('id', lesson_id).limit(1).execute()
     data = response.data or []
     if data:
-        content = data[0].get('content') or {}
-        image_paths = content.get('images') or []
+        image_paths = data[0].get('images') or []
         if image_paths:
-            # Удаляем изображения из Storage.
-            supabase.storage.from_(STORAGE_BUCKET).remove(image_paths)
+            # Оставляем только изображения без ссылок из других уроков.
+            unused = supabase.rpc('unreferenced_images', {
+                'p_paths': image_paths,
+                'p_exclude_lesson': lesson_id,
+            }).execute().data or []
+            unused_paths = [row['path'] for row in unused]
+            if unused_paths:
+                # Удаляем изображения из Storage.
+                supabase.storage.from_(STORAGE_BUCKET).remove(unused_paths)
+                _forget_objects(unused_paths)
     # Удаляем сам урок.
     supabase.table('lessons').delete().eq('id', lesson_id).execute()
+    notify_content_write('lessons', lesson_id)
 
-# Загружаем изображение в Storage.
-def upload_image(file_bytes: bytes, filename: str, content_type: str) -> Dict[str, str]:
-    # Генерируем уникальный путь.
-    ext = os.path.splitext(filename)[1].lower() or '.png'
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    # Загружаем файл в бакет.
-    supabase.storage.from_(STORAGE_BUCKET).upload(
-        unique_name,
-        file_bytes,
-        {"content-type": content_type, "x-upsert": "true"},
+# Получаем тесты урока (для ключа ответов).
+def get_lesson_tests(lesson_id: str) -> Dict[str, Any] | None:
+    # Выбираем только статус и тесты из content.
+    response = (
+        supabase.table('lessons')
+        .select('id,status,updated_at,tests:content->tests')
+        .eq('id', lesson_id)
+        .limit(1)
+        .execute()
+    )
+    data = response.data or []
+    return data[0] if data else None
+
+# Сохраняем пачку попыток прохождения тестов одним запросом.
+def insert_attempts(rows: List[Dict[str, Any]]) -> None:
+    # Пакетная вставка.
+    supabase.table('lesson_attempts').insert(rows).execute()
+
+# Получаем сводку попыток по урокам.
+def get_attempt_summary(lesson_ids: List[str] | None = None) -> List[Dict[str, Any]]:
+    # Читаем агрегированное представление (при необходимости — только по части уроков).
+    query = supabase.table('lesson_attempt_summary').select('*')
+    if lesson_ids is not None:
+        query = query.in_('lesson_id', lesson_ids)
+    response = query.execute()
+    return response.data or []
+
+# Получаем статистику попыток по вопросам урока.
+def get_attempt_question_stats(lesson_id: str) -> List[Dict[str, Any]]:
+    # Читаем агрегированное представление по вопросам.
+    response = (
+        supabase.table('lesson_attempt_question_stats')
+        .select('*')
+        .eq('lesson_id', lesson_id)
+        .order('question_index')
+        .execute()
+    )
+    return response.data or []
+
+# Прибавляем дельты счётчиков просмотров одним вызовом функции базы.
+def increment_page_counters(rows: List[Dict[str, Any]]) -> None:
+    # Функция делает пакетный upsert с суммированием.
+    supabase.rpc('increment_page_counters', {'p_rows': rows}).execute()
+
+# Получаем счётчики просмотров.
+def get_page_counters(kind: str, target_ids: List[str] | None = None) -> List[Dict[str, Any]]:
+    # Фильтруем по типу страницы и, при необходимости, по id.
+    query = supabase.table('page_counters').select('target_id,views,time_ms').eq('kind', kind)
+    if target_ids is not None:
+        query = query.in_('target_id', target_ids)
+    response = query.execute()
+    return response.data or []
+
+# Колонки списка ревизий (без сжатых данных).
+REVISION_LISTING_COLUMNS = 'number,kind,content_hash,size,created_at'
+
+# Получаем последнюю ревизию урока (без данных).
+def get_last_revision(lesson_id: str) -> Dict[str, Any] | None:
+    response = (
+        supabase.table('lesson_revisions')
+        .select(REVISION_LISTING_COLUMNS)
+        .eq('lesson_id', lesson_id)
+        .order('number', desc=True)
+        .limit(1)
+        .execute()
     )
+    data = response.data or []
+    return data[0] if data else None
+
+# Получаем список ревизий урока, от новых к старым.
+def get_revisions(lesson_id: str) -> List[Dict[str, Any]]:
+    response = (
+        supabase.table('lesson_revisions')
+        .select(REVISION_LISTING_COLUMNS)
+        .eq('lesson_id', lesson_id)
+        .order('number', desc=True)
+        .execute()
+    )
+    return response.data or []
+
+# Получаем цепочку ревизий для восстановления номера number: ближайший полный снимок и дельты после него.
+def get_revision_chain(lesson_id: str, number: int) -> List[Dict[str, Any]]:
+    snapshot = (
+        supabase.table('lesson_revisions')
+        .select('number')
+        .eq('lesson_id', lesson_id)
+        .eq('kind', 'snapshot')
+        .lte('number', number)
+        .order('number', desc=True)
+        .limit(1)
+        .execute()
+    ).data or []
+    if not snapshot:
+        return []
+    response = (
+        supabase.table('lesson_revisions')
+        .select('number,kind,content_hash,data')
+        .eq('lesson_id', lesson_id)
+        .gte('number', snapshot[0]['number'])
+        .lte('number', number)
+        .order('number')
+        .execute()
+    )
+    return response.data or []
+
+# Добавляем ревизию; False, если номер уже занят параллельным сохранением.
+def insert_revision(row: Dict[str, Any]) -> bool:
+    # Импортируем ошибку PostgREST (пакет уже загружен вместе с клиентом).
+    from postgrest.exceptions import APIError
+
+    try:
+        supabase.table('lesson_revisions').insert(row).execute()
+    except APIError as exc:
+        # 23505 — нарушение уникальности (lesson_id, number).
+        if exc.code == '23505':
+            return False
+        raise
+    return True
+
+# Имя объекта по содержимому: SHA-256 и расширение по типу файла.
+def image_object_name(digest: str, filename: str, content_type: str) -> str:
+    # Одинаковые байты дают одинаковое имя, поэтому повторная загрузка не создаёт дубликат.
+    ext = IMAGE_EXTENSIONS.get(content_type) or os.path.splitext(filename or '')[1].lower() or '.png'
+    return f"{digest}{ext}"
+
+# Запоминаем подтверждённый объект на KNOWN_OBJECTS_TTL секунд.
+def _remember_object(path: str) -> None:
+    with _known_objects_lock:
+        if len(_known_objects) >= KNOWN_OBJECTS_MAX:
+            _known_objects.clear()
+        _known_objects[path] = time.monotonic() + KNOWN_OBJECTS_TTL
+
+# Забываем удалённые объекты.
+def _forget_objects(paths: List[str]) -> None:
+    with _known_objects_lock:
+        for path in paths:
+            _known_objects.pop(path, None)
+
+# Проверяем, есть ли объект в Storage (с кэшем известных объектов; устаревшая запись перепроверяется).
+def image_exists(path: str) -> bool:
+    with _known_objects_lock:
+        expires_at = _known_objects.get(path)
+    if expires_at is not None and expires_at > time.monotonic():
+        return True
+    if supabase.storage.from_(STORAGE_BUCKET).exists(path):
+        _remember_object(path)
+        return True
+    _forget_objects([path])
+    return False
+
+# Ищем уже загруженное изображение по хэшу содержимого.
+def find_image(digest: str, content_type: str) -> Dict[str, str] | None:
+    path = image_object_name(digest, '', content_type)
+    if not image_exists(path):
+        return None
+    return {"path": path, "url": supabase.storage.from_(STORAGE_BUCKET).get_public_url(path)}
+
+# Загружаем изображение в Storage (без повторной передачи уже существующих объектов).
+def upload_image(file_bytes: bytes, filename: str, content_type: str) -> Dict[str, str]:
+    # Путь определяется содержимым файла.
+    path = image_object_name(hashlib.sha256(file_bytes).hexdigest(), filename, content_type)
+    bucket = supabase.storage.from_(STORAGE_BUCKET)
+    if not image_exists(path):
+        # Загружаем файл в бакет; содержимое по пути не меняется, поэтому кэшируем надолго.
+        bucket.upload(
+            path,
+            file_bytes,
+            {"content-type": content_type, "x-upsert": "true", "cache-control": "31536000"},
+        )
+        _remember_object(path)
     # Получаем публичный URL.
-    public_url = supabase.storage.from_(STORAGE_BUCKET).get_public_url(unique_name)
-    return {"path": unique_name, "url": public_url}
+    public_url = bucket.get_public_url(path)
+    return {"path": path, "url": public_url}
+
+# Скачиваем изображение из Storage.
+def download_image(path: str) -> bytes:
+    return supabase.storage.from_(STORAGE_BUCKET).download(path)
 
 # Извлекаем пути изображений из HTML.
 def extract_image_paths(html: str) -> List[str]:
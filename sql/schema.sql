@@ -90,3 +90,162 @@ create trigger trg_lessons_updated
 before update on public.lessons
 for each row
 execute function public.set_updated_at();
+
+-- Таблица попыток прохождения тестов (пишется пакетами из буфера приложения).
+create table if not exists public.lesson_attempts (
+    -- Уникальный идентификатор попытки.
+    id bigint generated always as identity primary key,
+    -- Внешний ключ на урок.
+    lesson_id uuid not null references public.lessons(id) on delete cascade,
+    -- Выбранные варианты по порядку вопросов (null — без ответа).
+    answers jsonb not null default '[]'::jsonb,
+    -- Результаты по вопросам: true/false.
+    results jsonb not null default '[]'::jsonb,
+    -- Количество верных ответов и число вопросов.
+    score integer not null,
+    total integer not null,
+    -- Дата попытки.
+    created_at timestamptz not null default now()
+);
+
+-- Индекс для выборки попыток по уроку.
+create index if not exists lesson_attempts_lesson_idx on public.lesson_attempts(lesson_id);
+
+-- Сводка попыток по урокам (для дашборда).
+create or replace view public.lesson_attempt_summary as
+select
+    lesson_id,
+    count(*) as attempts,
+    round(avg(score::numeric / nullif(total, 0)) * 100) as avg_percent
+from public.lesson_attempts
+group by lesson_id;
+
+-- Статистика попыток по вопросам урока.
+create or replace view public.lesson_attempt_question_stats as
+select
+    a.lesson_id,
+    (r.ordinality - 1)::integer as question_index,
+    count(*) as attempts,
+    count(*) filter (where r.value = 'true'::jsonb) as correct
+from public.lesson_attempts a
+cross join lateral jsonb_array_elements(a.results) with ordinality as r(value, ordinality)
+group by a.lesson_id, r.ordinality;
+
+-- Счётчики просмотров и времени на странице (дельты сбрасываются пакетами из приложения).
+create table if not exists public.page_counters (
+    -- Тип страницы: lesson или section.
+    kind text not null check (kind in ('lesson', 'section')),
+    -- Идентификатор урока или раздела.
+    target_id uuid not null,
+    -- Число просмотров.
+    views bigint not null default 0,
+    -- Суммарное время на странице в миллисекундах.
+    time_ms bigint not null default 0,
+    -- Дата последнего обновления.
+    updated_at timestamptz not null default now(),
+    primary key (kind, target_id)
+);
+
+-- Пакетное прибавление дельт счётчиков одним запросом.
+create or replace function public.increment_page_counters(p_rows jsonb)
+returns void as $$
+    insert into public.page_counters as c (kind, target_id, views, time_ms)
+    select r.kind, r.target_id, r.views, r.time_ms
+    from jsonb_to_recordset(p_rows) as r(kind text, target_id uuid, views bigint, time_ms bigint)
+    on conflict (kind, target_id) do update
+    set views = c.views + excluded.views,
+        time_ms = c.time_ms + excluded.time_ms,
+        updated_at = now();
+$$ language sql;
+
+-- Количество уроков по разделам (для дашборда админки и lastmod в sitemap).
+create or replace view public.section_lesson_counts as
+select
+    section_id,
+    count(*) as total,
+    count(*) filter (where status = 'published') as published,
+    max(updated_at) filter (where status = 'published') as published_updated_at
+from public.lessons
+group by section_id;
+
+-- Делаем ограничения уникальности номеров откладываемыми, чтобы менять порядок одной транзакцией.
+alter table public.sections drop constraint if exists sections_number_key;
+alter table public.sections
+    add constraint sections_number_key unique (number) deferrable initially immediate;
+alter table public.lessons drop constraint if exists lessons_section_id_number_key;
+alter table public.lessons
+    add constraint lessons_section_id_number_key unique (section_id, number) deferrable initially immediate;
+
+-- Атомарное изменение порядка разделов и/или уроков.
+-- p_section_ids — полный порядок разделов (null — не менять),
+-- p_lessons — объект {section_id: [lesson_id, ...]} с полным порядком уроков раздела.
+create or replace function public.reorder_catalog(p_section_ids uuid[] default null, p_lessons jsonb default '{}'::jsonb)
+returns void as $$
+declare
+    v_entry record;
+    v_ids uuid[];
+begin
+    -- Проверка уникальности номеров — в конце транзакции.
+    set constraints public.sections_number_key, public.lessons_section_id_number_key deferred;
+
+    if p_section_ids is not null then
+        -- Порядок должен содержать каждый раздел ровно один раз.
+        if (select count(*) from public.sections) <> cardinality(p_section_ids)
+            or (select count(*) from public.sections where id = any(p_section_ids)) <> cardinality(p_section_ids) then
+            raise exception 'Порядок должен содержать все разделы ровно один раз.' using errcode = '22023';
+        end if;
+        update public.sections s
+        set number = o.position
+        from unnest(p_section_ids) with ordinality as o(id, position)
+        where s.id = o.id and s.number <> o.position;
+    end if;
+
+    for v_entry in select key::uuid as section_id, value as ids from jsonb_each(coalesce(p_lessons, '{}'::jsonb)) loop
+        v_ids := array(select jsonb_array_elements_text(v_entry.ids)::uuid);
+        -- Порядок должен содержать каждый урок раздела ровно один раз.
+        if (select count(*) from public.lessons where section_id = v_entry.section_id) <> cardinality(v_ids)
+            or (select count(*) from public.lessons where section_id = v_entry.section_id and id = any(v_ids)) <> cardinality(v_ids) then
+            raise exception 'Порядок должен содержать все уроки раздела ровно один раз.' using errcode = '22023';
+        end if;
+        update public.lessons l
+        set number = o.position
+        from unnest(v_ids) with ordinality as o(id, position)
+        where l.id = o.id and l.number <> o.position;
+    end loop;
+end;
+$$ language plpgsql;
+
+-- Индекс для поиска уроков, ссылающихся на изображение.
+create index if not exists lessons_content_images_idx on public.lessons using gin ((content->'images'));
+
+-- Изображения из p_paths, на которые не ссылается ни один урок, кроме p_exclude_lesson.
+-- Имена объектов совпадают у одинаковых файлов, поэтому удалять можно только неиспользуемые.
+create or replace function public.unreferenced_images(p_paths text[], p_exclude_lesson uuid default null)
+returns table(path text) as $$
+    select p
+    from unnest(p_paths) as p
+    where not exists (
+        select 1 from public.lessons l
+        where l.content->'images' ? p
+          and l.id is distinct from p_exclude_lesson
+    );
+$$ language sql stable;
+
+-- Ревизии уроков: полный снимок каждые K ревизий, между ними — сжатые дельты (JSON Patch).
+create table if not exists public.lesson_revisions (
+    -- Внешний ключ на урок.
+    lesson_id uuid not null references public.lessons(id) on delete cascade,
+    -- Порядковый номер ревизии урока (с 1).
+    number integer not null,
+    -- Тип записи: полный снимок или дельта к предыдущей ревизии.
+    kind text not null check (kind in ('snapshot', 'delta')),
+    -- SHA-256 документа ревизии: одинаковые сохранения не записываются.
+    content_hash text not null,
+    -- Снимок или дельта: JSON, сжатый zlib, в base64.
+    data text not null,
+    -- Размер документа ревизии без сжатия (байт).
+    size integer not null,
+    -- Дата сохранения.
+    created_at timestamptz not null default now(),
+    primary key (lesson_id, number)
+);
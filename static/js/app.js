@@ -25,29 +25,189 @@ if (themeToggle) {
     });
 }
 
-// Логика прохождения тестов.
-const testBlocks = document.querySelectorAll('.test-question');
-
-testBlocks.forEach((block) => {
-    const correctIndex = Number(block.dataset.correct);
-    const options = block.querySelectorAll('.test-option');
-    let answered = false;
-
-    options.forEach((btn) => {
-        btn.addEventListener('click', () => {
-            if (answered) return;
-            answered = true;
-
-            const index = Number(btn.dataset.index);
-
-            options.forEach((optionBtn) => {
-                const optIndex = Number(optionBtn.dataset.index);
-                if (optIndex === correctIndex) {
-                    optionBtn.classList.add('correct');
-                } else if (optIndex === index) {
-                    optionBtn.classList.add('wrong');
-                }
+// Учёт времени на странице: отправляем beacon при уходе со страницы.
+const beaconTarget = document.querySelector('[data-beacon-kind]');
+if (beaconTarget && navigator.sendBeacon) {
+    let visibleSince = document.visibilityState === 'visible' ? Date.now() : null;
+    let visibleMs = 0;
+    // Страница загружена браузером заранее: сервер не учёл просмотр, учитываем его при первом показе.
+    let pendingView = beaconTarget.dataset.beaconView === '1';
+
+    const sendPageBeacon = (ms, view) => {
+        const payload = JSON.stringify({
+            kind: beaconTarget.dataset.beaconKind,
+            id: beaconTarget.dataset.beaconId,
+            ms,
+            view,
+        });
+        navigator.sendBeacon('/api/beacon', new Blob([payload], { type: 'application/json' }));
+    };
+    const reportView = () => {
+        if (!pendingView || document.prerendering || document.visibilityState !== 'visible') return;
+        pendingView = false;
+        sendPageBeacon(0, true);
+    };
+    reportView();
+    document.addEventListener('prerenderingchange', reportView);
+
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') {
+            visibleSince = Date.now();
+            reportView();
+            return;
+        }
+        if (visibleSince !== null) {
+            visibleMs += Date.now() - visibleSince;
+            visibleSince = null;
+        }
+        if (visibleMs > 0) {
+            sendPageBeacon(visibleMs, false);
+            visibleMs = 0;
+        }
+    });
+}
+
+// Следующий урок: браузеры без Speculation Rules загружают его через <link rel="prefetch">.
+const prefetchUrl = document.querySelector('meta[name="prefetch-url"]')?.content;
+if (prefetchUrl && !HTMLScriptElement.supports?.('speculationrules')) {
+    const link = document.createElement('link');
+    link.rel = 'prefetch';
+    link.href = prefetchUrl;
+    document.head.appendChild(link);
+}
+
+// Логика прохождения тестов (проверка на сервере).
+function initTests(testsBlock) {
+    const testBlocks = testsBlock.querySelectorAll('.test-question');
+    const submitTestsBtn = testsBlock.querySelector('#submitTests');
+    const testsResultEl = testsBlock.querySelector('#testsResult');
+    const selectedAnswers = Array.from(testBlocks, () => null);
+    let testsSubmitted = false;
+
+    testBlocks.forEach((block, questionIndex) => {
+        const options = block.querySelectorAll('.test-option');
+
+        options.forEach((btn) => {
+            btn.addEventListener('click', () => {
+                if (testsSubmitted) return;
+                selectedAnswers[questionIndex] = Number(btn.dataset.index);
+                options.forEach((optionBtn) => optionBtn.classList.toggle('selected', optionBtn === btn));
             });
         });
     });
-});
+
+    // Отправляем ответы и показываем результат.
+    submitTestsBtn?.addEventListener('click', async () => {
+        if (testsSubmitted) return;
+        submitTestsBtn.disabled = true;
+
+        try {
+            const response = await fetch(`/api/lessons/${testsBlock.dataset.lessonId}/attempts`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ answers: selectedAnswers }),
+            });
+            const result = await response.json().catch(() => ({}));
+            if (!response.ok) throw new Error(result.detail || 'Не удалось проверить ответы');
+
+            // Сервер сообщает только, верен ли выбранный ответ (null — вопрос без ответа).
+            testsSubmitted = true;
+            testBlocks.forEach((block, questionIndex) => {
+                const isCorrect = result.results[questionIndex];
+                block.querySelectorAll('.test-option').forEach((optionBtn) => {
+                    const optIndex = Number(optionBtn.dataset.index);
+                    optionBtn.classList.remove('selected');
+                    if (optIndex === selectedAnswers[questionIndex]) {
+                        optionBtn.classList.add(isCorrect ? 'correct' : 'wrong');
+                    }
+                });
+            });
+            if (testsResultEl) {
+                testsResultEl.textContent = `Верно: ${result.score} из ${result.total}`;
+            }
+        } catch (err) {
+            submitTestsBtn.disabled = false;
+            if (testsResultEl) testsResultEl.textContent = err.message;
+        }
+    });
+}
+
+// Код уроков подсвечивается на сервере при сохранении. Prism подгружается только для блоков,
+// сохранённых до этого (у них нет класса highlight).
+const PRISM_CDN = 'https://cdn.jsdelivr.net/npm/prismjs@1.29.0';
+const PRISM_COMPONENTS = ['python', 'javascript', 'css', 'markup'];
+const LEGACY_CODE_SELECTOR = 'pre:not(.highlight) > code[class*="language-"]';
+let prismLoading = null;
+
+// Подключаем внешний скрипт.
+function loadScript(src) {
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onload = resolve;
+        script.onerror = reject;
+        document.head.appendChild(script);
+    });
+}
+
+// Prism с нужными языками загружается один раз.
+function loadPrism() {
+    if (!prismLoading) {
+        const link = document.createElement('link');
+        link.rel = 'stylesheet';
+        link.href = `${PRISM_CDN}/themes/prism.min.css`;
+        document.head.appendChild(link);
+        window.Prism = window.Prism || {};
+        window.Prism.manual = true;
+        prismLoading = loadScript(`${PRISM_CDN}/prism.min.js`)
+            .then(() => Promise.all(PRISM_COMPONENTS.map((name) => loadScript(`${PRISM_CDN}/components/prism-${name}.min.js`))));
+    }
+    return prismLoading;
+}
+
+// Подсвечиваем старые блоки кода внутри контейнера.
+function highlightLegacyCode(container) {
+    if (!container.querySelector(LEGACY_CODE_SELECTOR)) return;
+    loadPrism()
+        .then(() => container.querySelectorAll(LEGACY_CODE_SELECTOR).forEach((el) => window.Prism.highlightElement(el)))
+        .catch(() => {});
+}
+
+highlightLegacyCode(document);
+
+// Подгрузка фрагментов урока (тесты, задачи), когда блок приближается к области видимости.
+async function loadFragment(block) {
+    const body = block.querySelector('.fragment-body');
+    try {
+        const response = await fetch(block.dataset.fragmentUrl);
+        if (!response.ok) throw new Error('Не удалось загрузить блок');
+        const html = (await response.text()).trim();
+        if (!html) {
+            block.hidden = true;
+            return;
+        }
+        body.innerHTML = html;
+        highlightLegacyCode(body);
+        if (block.classList.contains('tests')) initTests(block);
+    } catch (err) {
+        body.innerHTML = '';
+        const message = document.createElement('p');
+        message.className = 'empty-state';
+        message.textContent = err.message;
+        body.appendChild(message);
+    }
+}
+
+const fragmentBlocks = document.querySelectorAll('[data-fragment-url]');
+if ('IntersectionObserver' in window) {
+    const fragmentObserver = new IntersectionObserver((entries) => {
+        entries.forEach((entry) => {
+            if (!entry.isIntersecting) return;
+            fragmentObserver.unobserve(entry.target);
+            loadFragment(entry.target);
+        });
+    }, { rootMargin: '600px' });
+    fragmentBlocks.forEach((block) => fragmentObserver.observe(block));
+} else {
+    fragmentBlocks.forEach((block) => loadFragment(block));
+}
@@ -0,0 +1,185 @@
+﻿// Назначение файла: ленивая постраничная подгрузка уроков разделов на дашборде админки.
+
+const dashboardCsrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '';
+const LESSONS_PER_PAGE = 20;
+
+// Экранирование текста для вставки в HTML.
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value ?? '';
+    return div.innerHTML;
+}
+
+// Разметка карточки урока (повторяет серверный шаблон).
+function renderLessonCard(lesson) {
+    const badge = lesson.status === 'published'
+        ? '<div class="status-badge published">Опубликован</div>'
+        : '<div class="status-badge draft">Черновик</div>';
+
+    let stats = '';
+    if (lesson.counters && lesson.counters.views) {
+        const avgSeconds = Math.round(lesson.counters.time_ms / lesson.counters.views / 1000);
+        stats += `<div class="lesson-stats">Просмотров: ${lesson.counters.views} · в среднем ${avgSeconds} с на странице</div>`;
+    }
+    if (lesson.attempts) {
+        stats += `<div class="lesson-stats">Попыток: ${lesson.attempts.attempts} · средний результат: ${lesson.attempts.avg_percent}%</div>`;
+    }
+
+    return `
+        <div class="lesson-card" data-id="${escapeHtml(lesson.id)}">
+            <div class="lesson-info">
+                <div class="lesson-name"><span class="drag-handle" title="Перетащите, чтобы изменить порядок">⠿</span> Урок ${lesson.number}: ${escapeHtml(lesson.title)}</div>
+                ${badge}
+                ${stats}
+            </div>
+            <div class="lesson-actions">
+                <a class="btn" href="/bod/lesson/edit/${escapeHtml(lesson.id)}">Редактировать</a>
+                <form method="post" action="/bod/lesson/delete/${escapeHtml(lesson.id)}">
+                    <input type="hidden" name="csrf_token" value="${escapeHtml(dashboardCsrfToken)}" />
+                    <button class="btn danger" type="submit">Удалить</button>
+                </form>
+            </div>
+        </div>`;
+}
+
+// Сохраняем новый порядок одним запросом.
+async function saveOrder(payload) {
+    const response = await fetch('/api/reorder', {
+        method: 'PUT',
+        headers: { 'Content-Type': 'application/json', 'X-CSRF-Token': dashboardCsrfToken },
+        body: JSON.stringify(payload),
+    });
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'Не удалось сохранить порядок');
+    }
+}
+
+// Перетаскивание элементов списка за ручку; onReorder получает новый порядок id.
+function makeSortable(container, itemSelector, onReorder) {
+    let dragged = null;
+
+    container.addEventListener('mousedown', (e) => {
+        const handle = e.target.closest('.drag-handle');
+        const item = handle?.closest(itemSelector);
+        if (item && item.parentElement === container) item.draggable = true;
+    });
+    container.addEventListener('dragstart', (e) => {
+        if (!e.target.matches?.(itemSelector) || e.target.parentElement !== container) return;
+        dragged = e.target;
+        dragged.classList.add('dragging');
+        e.dataTransfer.effectAllowed = 'move';
+    });
+    container.addEventListener('dragover', (e) => {
+        if (!dragged) return;
+        e.preventDefault();
+        const target = e.target.closest(itemSelector);
+        if (!target || target === dragged || target.parentElement !== container) return;
+        const rect = target.getBoundingClientRect();
+        const after = e.clientY > rect.top + rect.height / 2;
+        container.insertBefore(dragged, after ? target.nextSibling : target);
+    });
+    container.addEventListener('dragend', () => {
+        if (!dragged) return;
+        dragged.classList.remove('dragging');
+        dragged.draggable = false;
+        dragged = null;
+        const ids = Array.from(container.children)
+            .filter((el) => el.matches(itemSelector))
+            .map((el) => el.dataset.id);
+        onReorder(ids);
+    });
+}
+
+// Контроллер списка уроков одного раздела.
+function setupLessonsList(container) {
+    const sectionId = container.dataset.sectionId;
+    const listEl = container.querySelector('.lessons-list');
+    const moreBtn = container.querySelector('.lessons-more');
+    const statusSelect = container.querySelector('.lessons-status');
+    const sortSelect = container.querySelector('.lessons-sort');
+    let page = 0;
+    let loading = false;
+
+    async function loadPage(reset = false) {
+        if (loading) return;
+        loading = true;
+        if (reset) {
+            page = 0;
+            listEl.innerHTML = '';
+        }
+
+        const params = new URLSearchParams({
+            page: String(page + 1),
+            per_page: String(LESSONS_PER_PAGE),
+            sort: sortSelect.value,
+        });
+        if (statusSelect.value) params.set('status', statusSelect.value);
+
+        try {
+            const response = await fetch(`/api/sections/${sectionId}/lessons?${params}`);
+            if (!response.ok) throw new Error('Не удалось загрузить уроки');
+            const data = await response.json();
+            page = data.page;
+            listEl.insertAdjacentHTML('beforeend', data.items.map(renderLessonCard).join(''));
+            if (!data.total) {
+                listEl.innerHTML = '<p class="empty-state">Нет уроков с таким статусом.</p>';
+            }
+            moreBtn.hidden = page * data.per_page >= data.total;
+            // Порядок можно менять, только когда виден весь раздел в исходной сортировке.
+            const sortable = moreBtn.hidden && !statusSelect.value && sortSelect.value === 'number';
+            container.classList.toggle('is-sortable', sortable);
+        } catch (err) {
+            listEl.insertAdjacentHTML('beforeend', `<p class="empty-state">${escapeHtml(err.message)}</p>`);
+        } finally {
+            loading = false;
+        }
+    }
+
+    makeSortable(listEl, '.lesson-card', async (ids) => {
+        if (!container.classList.contains('is-sortable')) return;
+        try {
+            await saveOrder({ lessons: { [sectionId]: ids } });
+        } catch (err) {
+            alert(err.message);
+        }
+        loadPage(true);
+    });
+
+    moreBtn.addEventListener('click', () => loadPage());
+    statusSelect.addEventListener('change', () => loadPage(true));
+    sortSelect.addEventListener('change', () => loadPage(true));
+
+    return () => loadPage(true);
+}
+
+// Подгружаем уроки раздела, когда он попадает в область видимости.
+const lazyContainers = document.querySelectorAll('.lessons-lazy');
+const loaders = new Map();
+lazyContainers.forEach((container) => loaders.set(container, setupLessonsList(container)));
+
+if ('IntersectionObserver' in window) {
+    const observer = new IntersectionObserver((entries) => {
+        entries.forEach((entry) => {
+            if (!entry.isIntersecting) return;
+            observer.unobserve(entry.target);
+            loaders.get(entry.target)?.();
+        });
+    }, { rootMargin: '200px' });
+    lazyContainers.forEach((container) => observer.observe(container));
+} else {
+    loaders.forEach((load) => load());
+}
+
+// Перетаскивание разделов: номера входят в адреса страниц, поэтому после сохранения перезагружаем дашборд.
+const sectionsBoard = document.getElementById('sectionsBoard');
+if (sectionsBoard) {
+    makeSortable(sectionsBoard, '.section-card', async (ids) => {
+        try {
+            await saveOrder({ sections: ids });
+        } catch (err) {
+            alert(err.message);
+        }
+        window.location.reload();
+    });
+}
@@ -28,12 +28,13 @@ const CustomImage = Image.extend({
 // Получаем CSRF-токен.
 const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '';
 
-// Загрузка изображения в backend.
-async function uploadImage(file) {
+// Пакетная загрузка изображений: результаты приходят NDJSON по мере готовности,
+// onResult вызывается в исходном порядке файлов.
+async function uploadImages(files, onResult) {
     const formData = new FormData();
-    formData.append('file', file);
+    files.forEach((file) => formData.append('files', file));
 
-    const response = await fetch('/api/upload-image', {
+    const response = await fetch('/api/upload-images', {
         method: 'POST',
         headers: { 'X-CSRF-Token': csrfToken },
         body: formData,
@@ -41,10 +42,103 @@ async function uploadImage(file) {
 
     if (!response.ok) {
         const data = await response.json().catch(() => ({}));
-        throw new Error(data.detail || 'Ошибка загрузки изображения');
+        throw new Error(data.detail || 'Ошибка загрузки изображений');
     }
 
-    return response.json();
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const ready = new Map();
+    let nextIndex = 0;
+    let buffer = '';
+
+    const flushReady = () => {
+        while (ready.has(nextIndex)) {
+            onResult(ready.get(nextIndex));
+            ready.delete(nextIndex);
+            nextIndex += 1;
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(Boolean).forEach((line) => {
+            const result = JSON.parse(line);
+            ready.set(result.index, result);
+        });
+        flushReady();
+    }
+}
+
+// SHA-256 содержимого файла в hex.
+async function hashFile(file) {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+// Ищем уже загруженные изображения по хэшу, чтобы не передавать их повторно.
+async function lookupImages(files) {
+    if (!window.crypto?.subtle) return files.map(() => null);
+    const images = await Promise.all(files.map(async (file) => ({
+        sha256: await hashFile(file),
+        content_type: file.type,
+    })));
+    const response = await fetch('/api/images/lookup', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-CSRF-Token': csrfToken },
+        body: JSON.stringify({ images }),
+    });
+    if (!response.ok) return files.map(() => null);
+    return (await response.json()).images;
+}
+
+// Вставляем изображения из файлов (выбор, вставка из буфера, перетаскивание).
+async function insertImageFiles(editor, files) {
+    const images = files.filter((file) => file.type.startsWith('image/'));
+    if (!images.length) return false;
+
+    const errors = [];
+    const ready = new Map();
+    let nextIndex = 0;
+
+    // Вставляем результаты строго в исходном порядке файлов.
+    const flushReady = () => {
+        while (ready.has(nextIndex)) {
+            const result = ready.get(nextIndex);
+            ready.delete(nextIndex);
+            nextIndex += 1;
+            if (result.error) {
+                errors.push(`${result.filename}: ${result.error}`);
+                continue;
+            }
+            editor.chain().focus().setImage({ src: result.url, 'data-path': result.path, alt: '' }).run();
+        }
+    };
+
+    (async () => {
+        // Уже загруженные файлы вставляем сразу, остальные отправляем на сервер.
+        const found = await lookupImages(images).catch(() => images.map(() => null));
+        const missing = [];
+        images.forEach((file, index) => {
+            if (found[index]) ready.set(index, found[index]);
+            else missing.push(index);
+        });
+        flushReady();
+        if (missing.length) {
+            await uploadImages(missing.map((index) => images[index]), (result) => {
+                ready.set(missing[result.index], result);
+                flushReady();
+            });
+        }
+    })()
+        .then(() => {
+            if (errors.length) alert(errors.join('\n'));
+        })
+        .catch((err) => alert(err.message));
+    return true;
 }
 
 function resolveElement(target) {
@@ -60,8 +154,25 @@ function createEditor(target) {
     if (!element) {
         throw new Error('Tiptap target не найден.');
     }
-    return new Editor({
+    const editor = new Editor({
         element,
+        editorProps: {
+            // Вставка и перетаскивание нескольких изображений загружаются одним пакетом.
+            handlePaste: (view, event) => {
+                const files = Array.from(event.clipboardData?.files || []);
+                if (!files.length) return false;
+                event.preventDefault();
+                insertImageFiles(editor, files);
+                return true;
+            },
+            handleDrop: (view, event) => {
+                const files = Array.from(event.dataTransfer?.files || []);
+                if (!files.length) return false;
+                event.preventDefault();
+                insertImageFiles(editor, files);
+                return true;
+            },
+        },
         extensions: [
             StarterKit,
             Underline,
@@ -77,6 +188,7 @@ function createEditor(target) {
         ],
         content: '',
     });
+    return editor;
 }
 
 // Создаём тулбар.
@@ -180,16 +292,16 @@ async function insertImage(editor) {
     const input = document.createElement('input');
     input.type = 'file';
     input.accept = 'image/png,image/jpeg,image/webp,image/svg+xml';
+    input.multiple = true;
 
     input.onchange = async () => {
-        const file = input.files?.[0];
-        if (!file) return;
-        if (file.size > 5 * 1024 * 1024) {
-            alert('Файл больше 5 МБ');
-            return;
+        const files = Array.from(input.files || []);
+        if (!files.length) return;
+        const tooLarge = files.filter((file) => file.size > 5 * 1024 * 1024);
+        if (tooLarge.length) {
+            alert(`Файлы больше 5 МБ: ${tooLarge.map((file) => file.name).join(', ')}`);
         }
-        const result = await uploadImage(file);
-        editor.chain().focus().setImage({ src: result.url, 'data-path': result.path, alt: '' }).run();
+        await insertImageFiles(editor, files.filter((file) => file.size <= 5 * 1024 * 1024));
     };
 
     input.click();